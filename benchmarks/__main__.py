@@ -0,0 +1,6 @@
+"""Run all benchmarks: python -m benchmarks"""
+from . import bench_member_cache, bench_member_state, bench_sensor, bench_steam_lookup, bench_steam_memory
+
+for module in (bench_sensor, bench_steam_lookup, bench_steam_memory, bench_member_cache, bench_member_state):
+    print(f"== {module.__name__}")
+    module.main()
@@ -0,0 +1,104 @@
+"""Benchmark the memory held by the nextcord client caches.
+
+Compares the previous client (every intent, every member cached, 1000 messages cached) with the
+options from bot_options(), for a guild of MEMBERS members of which WATCHED are watched.
+GUILD_CREATE of a large guild only carries LARGE_THRESHOLD members, the previous client then
+chunked the guild to get the others, which is modelled by putting all of them in its GUILD_CREATE.
+
+Usage, from the repository root:
+    python -m benchmarks.bench_member_cache [members]
+"""
+import asyncio
+import gc
+import sys
+import tracemalloc
+
+import nextcord
+
+from custom_components.discord_game.connection import bot_options
+
+MEMBERS = 20_000
+WATCHED = 25
+MESSAGES = 1_000
+LARGE_THRESHOLD = 250
+GUILD_ID = 1
+CHANNEL_ID = 2
+
+
+def _user(user_id: int) -> dict:
+    return {"id": str(user_id), "username": f"user{user_id}", "global_name": f"User {user_id}",
+            "discriminator": "0", "avatar": f"{user_id:032x}"}
+
+
+def _member(user_id: int) -> dict:
+    return {"user": _user(user_id), "roles": [], "joined_at": "2024-01-01T00:00:00+00:00", "deaf": False,
+            "mute": False, "flags": 0}
+
+
+def _presence(user_id: int) -> dict:
+    return {"user": {"id": str(user_id)}, "status": "online", "client_status": {"desktop": "online"},
+            "activities": [{"type": 0, "name": f"Game {user_id % 500}", "created_at": 1700000000000}]}
+
+
+def _guild(members: int, included: int) -> dict:
+    user_ids = range(1000, 1000 + included)
+    return {
+        "id": str(GUILD_ID), "name": "Benchmark", "owner_id": "1000", "roles": [], "emojis": [], "stickers": [],
+        "features": [], "member_count": members, "large": True, "voice_states": [],
+        "channels": [{"id": str(CHANNEL_ID), "type": 0, "name": "general", "position": 0,
+                      "permission_overwrites": []}],
+        "members": [_member(user_id) for user_id in user_ids],
+        "presences": [_presence(user_id) for user_id in user_ids],
+    }
+
+
+def _message(message_id: int) -> dict:
+    return {"id": str(message_id), "channel_id": str(CHANNEL_ID), "guild_id": str(GUILD_ID),
+            "author": _user(1000 + message_id % 100), "content": "x" * 80, "timestamp": "2024-01-01T00:00:00+00:00",
+            "edited_timestamp": None, "tts": False, "mention_everyone": False, "mentions": [], "mention_roles": [],
+            "attachments": [], "embeds": [], "pinned": False, "type": 0}
+
+
+def _connect(client: nextcord.Client, guild_data: dict, messages: list, scoped: bool) -> None:
+    """Feed GUILD_CREATE and MESSAGE_CREATE payloads through the client's connection state."""
+    state = client._connection
+    guild = state._add_guild_from_data(guild_data)
+    if scoped:
+        # What on_ready's query_members(cache=True) puts in the cache
+        for user_id in range(1000, 1000 + WATCHED):
+            member = nextcord.Member(data=_member(user_id), guild=guild, state=state)
+            member._presence_update(_presence(user_id), _user(user_id))
+            guild._add_member(member)
+    for message in messages:
+        state.parse_message_create(message)
+
+
+def _retained(options: dict, members: int, scoped: bool):
+    """Return (client, cached members, bytes held by the client caches)."""
+    loop = asyncio.new_event_loop()
+    guild_data = _guild(members, min(members, LARGE_THRESHOLD) if scoped else members)
+    messages = [_message(message_id) for message_id in range(MESSAGES)]
+    gc.collect()
+    tracemalloc.start()
+    client = nextcord.Client(loop=loop, **options)
+    _connect(client, guild_data, messages, scoped)
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    cached = len(client.get_guild(GUILD_ID).members)
+    loop.close()
+    return client, cached, size
+
+
+def main(members: int = MEMBERS):
+    members = int(members)
+    print(f"guild: {members} members with presences, {WATCHED} watched, {MESSAGES} messages")
+    _, legacy_cached, legacy = _retained({"intents": nextcord.Intents.all()}, members, False)
+    print(f"Intents.all(), default caches: {legacy_cached:>6} members cached {legacy / 2**20:>7.1f} MiB")
+    _, scoped_cached, scoped = _retained(bot_options(True, True, True), members, True)
+    print(f"bot_options(): {scoped_cached:>22} members cached {scoped / 2**20:>7.1f} MiB "
+          f"({legacy / scoped:.1f}x smaller)")
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:2])
@@ -0,0 +1,144 @@
+"""Benchmark the memory and update throughput of the member state at WATCHED watched members.
+
+Compares whole member entities, without sub-entities, with the previous layout: about 55 sensor values
+as attributes in the __dict__ of every member entity, emulated with an entity holding the same values and
+the same playtime sessions. Both are built from the same members, with the strings they create. The
+current entities also hold their state attributes, the previous ones built them on every write. Also
+compares member entities with every sub-entity created against entities with only two enabled sub-entities.
+
+Usage, from the repository root:
+    python -m benchmarks.bench_member_state [watched]
+"""
+import asyncio
+import dataclasses
+import gc
+import itertools
+import sys
+import tracemalloc
+from types import SimpleNamespace
+
+from homeassistant.components.sensor import SensorEntity
+
+from custom_components.discord_game.assets import AssetUrlResolver
+from custom_components.discord_game.presence import VoiceRecord
+from custom_components.discord_game.sensor import MEMBER_SENSORS, STATE_ATTRIBUTES, DiscordAsyncMemberState, \
+    update_discord_entity
+from custom_components.discord_game.steam import SteamAppIndex, SteamArtworkCache
+
+from .catalog import synthetic_catalog
+from .fakes import StubCatalog, StubHass, StubSession, WriteCounter, custom_activity, fake_member, game_activity, \
+    spotify_activity
+from .harness import bench, bench_async
+
+WATCHED = 500
+
+# Sub-entities a user typically enables with entities_disabled_default on
+ENABLED_SENSORS = ("game", "voice_channel")
+
+
+def _retained(build):
+    """Return (result, bytes still allocated by build once it returned)."""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size
+
+
+class FlatMemberState(SensorEntity):
+    """The previous member entity layout, every sensor value an attribute of the entity."""
+
+
+def main(watched: int = WATCHED):
+    watched = int(watched)
+    appids, names = synthetic_catalog(20_000)
+    steam_catalog = StubCatalog(SteamAppIndex.build(appids, names))
+    steam_artwork = SteamArtworkCache(StubSession())
+    asset_urls = AssetUrlResolver()
+    hass = StubHass()
+    client = SimpleNamespace(available=True)
+    loop = asyncio.new_event_loop()
+
+    members = [
+        fake_member(user_id, [game_activity(names[user_id % 50]), spotify_activity(f"Song {user_id % 7}"),
+                              custom_activity()], voice_channel="General" if user_id % 3 else None)
+        for user_id in range(1, watched + 1)
+    ]
+    watchers = []
+    writes = WriteCounter()
+    for member in members:
+        watcher = DiscordAsyncMemberState(hass, client, member.name, member.global_name, member.id)
+        writes.attach(watcher)
+        for sensor in watcher.sensors.values():
+            sensor.hass = hass
+            writes.attach(sensor)
+        watchers.append(watcher)
+    for watcher, member in zip(watchers, members):
+        loop.run_until_complete(update_discord_entity(watcher, member, steam_catalog, steam_artwork, asset_urls))
+        watcher.async_write_changed_states()
+
+    print(f"{watched} watched members")
+
+    def _updated_entity(member) -> DiscordAsyncMemberState:
+        # Not added to hass, so the write only replaces the snapshot
+        entity = DiscordAsyncMemberState(None, client, member.name, member.global_name, member.id, sensors=())
+        loop.run_until_complete(update_discord_entity(entity, member, steam_catalog, steam_artwork, asset_urls))
+        entity.async_write_changed_states()
+        return entity
+
+    def _flat_entity(member) -> FlatMemberState:
+        # The values are flattened from a presence that is dropped again, as the previous layout did
+        updated = _updated_entity(member)
+        snapshot = updated.snapshot
+        entity = FlatMemberState()
+        entity.__dict__.update(hass=None, client=client, entities_disabled_default=False, sensors={},
+                               sessions=updated.sessions, member=updated.member, _state=snapshot.state,
+                               **{attr: snapshot.attributes[name] for name, attr in STATE_ATTRIBUTES})
+        entity.userid = updated.userid
+        return entity
+
+    # Presence records, state attributes, URL flags, sessions, everything a member entity holds
+    _, flat = _retained(lambda: [_flat_entity(member) for member in members])
+    _, current = _retained(lambda: [_updated_entity(member) for member in members])
+    print(f"{'entities, flat attributes:':<29}{flat / 2**10:>8.1f} KiB")
+    print(f"{'entities, records + snapshot:':<29}{current / 2**10:>8.1f} KiB ({current / flat:.2f}x the flat size)")
+
+    def _entities(sensors):
+        return [DiscordAsyncMemberState(hass, client, member.name, member.global_name, member.id, sensors=sensors)
+                for member in members]
+
+    _, every = _retained(lambda: _entities(MEMBER_SENSORS))
+    _, enabled = _retained(lambda: _entities(ENABLED_SENSORS))
+    print(f"{f'entities, {len(MEMBER_SENSORS)} sub-entities:':<29}{every / 2**10:>8.1f} KiB")
+    print(f"{f'entities, {len(ENABLED_SENSORS)} sub-entities:':<29}{enabled / 2**10:>8.1f} KiB "
+          f"({every / enabled:.1f}x smaller)")
+
+    # One member changes track, one member toggles self mute, round robin over the roster
+    tracks = itertools.cycle([
+        (watcher, fake_member(member.id, [game_activity(names[member.id % 50]), spotify_activity(song)],
+                              voice_channel="General" if member.id % 3 else None))
+        for song in ("Other", "Song") for watcher, member in zip(watchers, members)
+    ])
+
+    async def track_change():
+        watcher, member = next(tracks)
+        await update_discord_entity(watcher, member, steam_catalog, steam_artwork, asset_urls)
+        watcher.async_write_changed_states()
+
+    bench_async(f"update + write changed, track change ({watched} members)", track_change, number=5_000)
+
+    mutes = itertools.cycle([(watcher, mute) for mute in (True, False) for watcher in watchers])
+
+    def voice_change():
+        watcher, mute = next(mutes)
+        watcher.presence = dataclasses.replace(watcher.presence, voice=VoiceRecord("General", self_mute=mute))
+        watcher.async_write_changed_states()
+
+    bench(f"voice record replace + write changed ({watched} members)", voice_change, number=5_000)
+    loop.close()
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:2])
@@ -0,0 +1,122 @@
+"""Benchmark the sensor.py hot paths with fake Discord members and a stub hass.
+
+Usage, from the repository root:
+    python -m benchmarks.bench_sensor
+"""
+import itertools
+import random
+from types import SimpleNamespace
+
+from custom_components.discord_game.assets import AssetUrlResolver, _avatar_url, to_media_discord_url
+from custom_components.discord_game.sensor import DiscordAsyncMemberState, DiscordAsyncVoiceChannelState, \
+    DiscordRoleAggregate, role_member_entry, update_discord_entity, update_discord_entity_user
+from custom_components.discord_game.steam import SteamAppIndex, SteamArtworkCache, normalize_game_name
+
+from .catalog import synthetic_catalog
+from .fakes import StubCatalog, StubHass, StubSession, WriteCounter, custom_activity, fake_member, fake_user, \
+    game_activity, spotify_activity, watching_activity
+from .harness import bench, bench_async
+
+VOICE_CHANNEL_MEMBERS = 25
+ROLE_MEMBERS = 10_000
+
+
+def main():
+    appids, names = synthetic_catalog()
+    index = SteamAppIndex.build(appids, names)
+    steam_catalog = StubCatalog(index)
+    steam_artwork = SteamArtworkCache(StubSession())
+    asset_urls = AssetUrlResolver()
+    hass = StubHass()
+    client = SimpleNamespace(available=True)
+    game = names[len(names) // 2]
+
+    watcher = DiscordAsyncMemberState(hass, client, "user1", "User 1", 1)
+    writes = WriteCounter()
+    writes.attach(watcher)
+    for sensor in watcher.sensors.values():
+        sensor.hass = hass
+        writes.attach(sensor)
+
+    members = {
+        "no activity": fake_member(1),
+        "steam game + voice": fake_member(1, [game_activity(game)], voice_channel="General"),
+        "spotify": fake_member(1, [spotify_activity()]),
+        "game + spotify + custom + watching": fake_member(
+            1, [game_activity(game), spotify_activity(), custom_activity(), watching_activity()], voice_channel="General"
+        ),
+    }
+    for label, member in members.items():
+        bench_async(f"update_discord_entity ({label})",
+                    lambda m=member: update_discord_entity(watcher, m, steam_catalog, steam_artwork, asset_urls))
+
+    async def update_and_write(member):
+        await update_discord_entity(watcher, member, steam_catalog, steam_artwork, asset_urls)
+        watcher.async_write_changed_states()
+
+    # Identical presence updates, then a track change on every update
+    member = members["game + spotify + custom + watching"]
+    for label, states in (("repeated", [member]),
+                          ("track change", [member, fake_member(1, [game_activity(game), spotify_activity("Other")])])):
+        cycle = itertools.cycle(states)
+        writes.writes = 0
+        bench_async(f"update + write changed ({label})", lambda: update_and_write(next(cycle)), number=1000)
+        print(f"{'':<60} {writes.writes / 1002:>12.1f} state writes/update")
+
+    media_url = "https://cdn.discordapp.com/app-assets/432980957394370572/mp:external/def456/https/example.com/small_64.png"
+    bench("to_media_discord_url (external image)", lambda: to_media_discord_url(media_url))
+    bench("to_media_discord_url (app asset)",
+          lambda: to_media_discord_url("https://cdn.discordapp.com/app-assets/432980957394370572/123456.png"))
+    bench("AssetUrlResolver.media_url (external image)", lambda: asset_urls.media_url(media_url))
+
+    user = fake_user(1)
+    bench("avatar URL (uncached)", lambda: _avatar_url(user.display_avatar, "webp"))
+    bench("AssetUrlResolver.avatar_url", lambda: asset_urls.avatar_url(user, "webp"))
+    bench_async("update_discord_entity_user", lambda: update_discord_entity_user(watcher, user, "webp", asset_urls))
+    print(f"{'':<60} {asset_urls.as_dict()['hit_rate']:>12.3f} asset URL hit rate")
+
+    rnd = random.Random(3)
+    lookups = itertools.cycle([normalize_game_name(name).upper() for name in rnd.choices(names, k=50)])
+    bench("Steam name lookup (50 games)", lambda: steam_catalog.get_appid(next(lookups)), number=100_000)
+    cold_lookups = iter([normalize_game_name(name).upper() for name in rnd.choices(names, k=110_000)])
+    bench("Steam name lookup (uncached)", lambda: steam_catalog.get_appid(next(cold_lookups)), number=100_000)
+
+    bench("DiscordAsyncMemberState.extra_state_attributes", lambda: watcher.extra_state_attributes)
+    sensors = list(watcher.sensors.values())
+    bench(f"render {len(sensors)} sub-entities (native_value + entity_picture)",
+          lambda: [(sensor.native_value, sensor.entity_picture) for sensor in sensors], number=1000)
+
+    voice_channel = DiscordAsyncVoiceChannelState(hass, client, "General", 2)
+    voice_channel.reset_roster([fake_member(user_id) for user_id in range(VOICE_CHANNEL_MEMBERS)])
+    display_names = voice_channel.sensors["display_names"]
+    bench(f"VoiceChannelMembersSensor.native_value ({VOICE_CHANNEL_MEMBERS} members)", lambda: display_names.native_value)
+
+    # One member joins and leaves again, the roster is only updated by the delta
+    joiner = fake_member(VOICE_CHANNEL_MEMBERS)
+
+    def join_and_leave():
+        voice_channel.add_member(joiner)
+        voice_channel.remove_member(joiner.id)
+
+    bench(f"voice roster join + leave ({VOICE_CHANNEL_MEMBERS} members)", join_and_leave)
+    voice_channel.add_member(joiner)
+    bench(f"voice roster unchanged member update ({VOICE_CHANNEL_MEMBERS} members)",
+          lambda: voice_channel.add_member(joiner))
+
+    # Role members start playing and stop again, the counts are only moved by the delta
+    role_aggregate = DiscordRoleAggregate(hass, client, "Guild", "Gamers", 3)
+    role_aggregate.reset([fake_member(user_id) for user_id in range(ROLE_MEMBERS)])
+    presence_changes = itertools.cycle([
+        fake_member(user_id, activities) for activities in ([game_activity(names[0])], [])
+        for user_id in range(0, ROLE_MEMBERS, 7)
+    ])
+
+    def role_presence_change():
+        member = next(presence_changes)
+        role_aggregate.apply(member.id, role_member_entry(member))
+
+    bench(f"role aggregate presence update ({ROLE_MEMBERS} members)", role_presence_change, number=100_000)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""Benchmark building the Steam app index and looking up game names in it.
+
+Usage, from the repository root:
+    python -m benchmarks.bench_steam_lookup [path/to/.storage/discord_game.steam_app_catalog]
+"""
+import random
+import sys
+import time
+
+from custom_components.discord_game.steam import SteamAppIndex, normalize_game_name
+
+from .catalog import load_catalog
+
+LOOKUPS = 200_000
+
+
+def _ops_per_sec(func, names):
+    start = time.perf_counter()
+    for name in names:
+        func(name)
+    return len(names) / (time.perf_counter() - start)
+
+
+def main(path: str = None):
+    appids, names = load_catalog(path)
+    print(f"catalog: {len(names)} apps")
+
+    start = time.perf_counter()
+    index = SteamAppIndex.build(appids, names)
+    print(f"build index: {time.perf_counter() - start:.2f} s")
+
+    rnd = random.Random(2)
+    sample = rnd.choices(names, k=LOOKUPS)
+    exact = sample
+    # Same titles as Discord may report them: different casing, no symbols or edition suffix
+    variants = [normalize_game_name(name).upper() for name in sample]
+    misses = [f"unknown game {i}" for i in range(LOOKUPS)]
+    # Discord reports the same few games over and over
+    repeated = rnd.choices(variants[:50], k=LOOKUPS)
+
+    found = sum(index.get(name) is not None for name in variants)
+    print(f"normalized variants found: {found / LOOKUPS:.1%}")
+    for label, lookups in (("exact", exact), ("normalized", variants), ("normalized repeated", repeated),
+                           ("miss", misses)):
+        print(f"lookup {label}: {_ops_per_sec(index.get, lookups):,.0f} ops/s")
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:2])
@@ -0,0 +1,57 @@
+"""Benchmark the memory held by the Steam app catalog.
+
+Compares the previous in-memory structures (the list of app dicts, wrapped in addict Dict when
+it is installed, plus a name -> app dict) with SteamAppIndex.
+
+Usage, from the repository root:
+    python -m benchmarks.bench_steam_memory [path/to/.storage/discord_game.steam_app_catalog]
+"""
+import gc
+import sys
+import tracemalloc
+
+from custom_components.discord_game.steam import SteamAppIndex
+
+from .catalog import load_catalog
+
+try:
+    from addict import Dict
+except ImportError:
+    Dict = None
+
+
+def _retained(build):
+    """Return (result, bytes still allocated by build once it returned)."""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size
+
+
+def _legacy(appids, names):
+    # Shape of the GetAppList response as it used to be kept around
+    response = {"response": {"apps": [
+        {"appid": appid, "name": name, "last_modified": 1700000000 + appid, "price_change_number": appid * 3}
+        for appid, name in zip(appids, names)
+    ]}}
+    if Dict is not None:
+        response = Dict(response)
+    apps = response["response"]["apps"]
+    return apps, {app["name"]: app for app in apps}
+
+
+def main(path: str = None):
+    appids, names = load_catalog(path)
+    print(f"catalog: {len(names)} apps")
+    _, legacy = _retained(lambda: _legacy(appids, names))
+    label = "addict Dict" if Dict is not None else "dict"
+    print(f"list of {label} apps + name dict: {legacy / 2**20:.1f} MiB")
+    _, compact = _retained(lambda: SteamAppIndex.build(appids, names))
+    print(f"SteamAppIndex: {compact / 2**20:.1f} MiB ({legacy / compact:.1f}x smaller)")
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:2])
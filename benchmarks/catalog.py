@@ -0,0 +1,38 @@
+"""Steam app catalogs for the benchmarks.
+
+Either a synthetic catalog of realistic size, or the real one stored by the integration
+(<config>/.storage/discord_game.steam_app_catalog).
+"""
+import json
+import random
+
+CATALOG_SIZE = 200_000
+
+_WORDS = ["dark", "souls", "doom", "eternal", "war", "star", "legend", "tales", "night", "city", "space", "farm",
+          "simulator", "hunt", "wild", "craft", "hero", "dungeon", "quest", "racing", "zero", "shadow", "empire",
+          "knight", "dragon", "ghost", "iron", "planet", "rogue", "tactics", "island", "survival", "cyber", "punk"]
+_DECORATIONS = ["", "", "", "™", "®", ":", " -", " II", " 2", " Deluxe Edition", " GOTY Edition", " Remastered"]
+
+
+def synthetic_catalog(size: int = CATALOG_SIZE, seed: int = 1):
+    """Return (appids, names) of a deterministic synthetic catalog sorted by appid like the Steam API."""
+    rnd = random.Random(seed)
+    appids = sorted(rnd.sample(range(10, size * 20), size))
+    names = []
+    for _ in appids:
+        words = [rnd.choice(_WORDS) for _ in range(rnd.randint(1, 4))]
+        if rnd.random() < 0.5:
+            words = [w.capitalize() for w in words]
+        names.append(" ".join(words) + rnd.choice(_DECORATIONS))
+    return appids, names
+
+
+def stored_catalog(path: str):
+    """Return (appids, names) from the catalog file stored by the integration."""
+    with open(path, encoding="utf-8") as file:
+        data = json.load(file)["data"]
+    return data["appids"], data["names"]
+
+
+def load_catalog(path: str = None):
+    return stored_catalog(path) if path else synthetic_catalog()
@@ -0,0 +1,101 @@
+"""Offline stand-ins for Discord members and Home Assistant used by the benchmarks."""
+from types import SimpleNamespace
+
+import nextcord
+from nextcord import ActivityType, Status
+
+
+class StubHass:
+    """Enough of HomeAssistant for entities that are never added to a platform."""
+
+    def __init__(self):
+        self.data = {}
+
+
+class WriteCounter:
+    """Replaces async_schedule_update_ha_state on entities and counts the state writes."""
+
+    def __init__(self):
+        self.writes = 0
+
+    def attach(self, entity):
+        entity.async_schedule_update_ha_state = self._write
+
+    def _write(self, force_refresh=False):
+        self.writes += 1
+
+
+class StubCatalog:
+    """SteamAppCatalog without the Home Assistant storage, backed by a prebuilt SteamAppIndex."""
+
+    def __init__(self, index):
+        self.get_appid = index.get
+
+
+class StubSession:
+    """aiohttp session answering every artwork HEAD probe with 200."""
+
+    def head(self, url, timeout=None):
+        return _StubResponse()
+
+
+class _StubResponse:
+    status = 200
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return None
+
+
+def game_activity(name: str, application_id: int = 432980957394370572):
+    return nextcord.Activity(
+        type=ActivityType.playing, name=name, application_id=application_id, state="In a match", details="Ranked",
+        assets={
+            "large_image": "mp:external/abc123/https/example.com/images/large.png",
+            "large_text": name,
+            "small_image": "mp:external/def456/https/example.com/images/small_64.png",
+            "small_text": "Rank 12",
+        },
+    )
+
+
+def spotify_activity(title: str = "Song"):
+    return nextcord.Spotify(
+        name="Spotify", details=title, state="Artist One; Artist Two", sync_id="6rqhFgbbKwnb9MLmUQDhG6",
+        session_id="session", party={"id": "spotify:1"},
+        timestamps={"start": 1_700_000_000_000, "end": 1_700_000_200_000},
+        assets={"large_image": "spotify:ab67616d0000b273", "large_text": "Album"},
+    )
+
+
+def watching_activity(name: str = "YouTube"):
+    return nextcord.Activity(type=ActivityType.watching, name=name, details="Some video", url="https://youtube.com")
+
+
+def custom_activity(text: str = "Working"):
+    return nextcord.CustomActivity(name=text, emoji=nextcord.PartialEmoji(name="🔥"))
+
+
+def fake_user(user_id: int):
+    """A nextcord User look-alike with a custom avatar."""
+    avatar = nextcord.Asset._from_avatar(None, user_id, f"{user_id:032x}")
+    return SimpleNamespace(
+        id=user_id, name=f"user{user_id}", global_name=f"User {user_id}", avatar=avatar, display_avatar=avatar,
+        default_avatar=nextcord.Asset._from_default_avatar(None, user_id % 5),
+    )
+
+
+def fake_member(user_id: int, activities=(), voice_channel: str = None):
+    """A nextcord Member look-alike with everything update_discord_entity reads."""
+    voice = None
+    if voice_channel is not None:
+        voice = SimpleNamespace(channel=SimpleNamespace(name=voice_channel), deaf=False, mute=False, self_deaf=False,
+                                self_mute=True, self_stream=False, self_video=False, afk=False)
+    return SimpleNamespace(
+        id=user_id, name=f"user{user_id}", global_name=f"User {user_id}", display_name=f"User {user_id}",
+        status=Status.online, desktop_status=Status.online, mobile_status=Status.offline, web_status=Status.offline,
+        roles=[SimpleNamespace(name="@everyone"), SimpleNamespace(name="Gamers")],
+        voice=voice, activities=list(activities),
+    )
@@ -0,0 +1,47 @@
+"""Timing and allocation measurement shared by the benchmarks."""
+import asyncio
+import gc
+import time
+import tracemalloc
+
+
+def _report(label: str, ops: int, elapsed: float, peak: int, retained: int):
+    print(f"{label:<60} {ops / elapsed:>12,.0f} ops/s {peak / 1024:>9.1f} KiB peak/op {retained:>8} B retained/op")
+
+
+def _allocations(run_once):
+    """Return (peak bytes, retained bytes) allocated by one call of run_once."""
+    gc.collect()
+    tracemalloc.start()
+    run_once()
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, retained
+
+
+def bench(label: str, func, number: int = 10_000):
+    """Measure ops/sec and allocations of a synchronous callable."""
+    func()
+    start = time.perf_counter()
+    for _ in range(number):
+        func()
+    elapsed = time.perf_counter() - start
+    _report(label, number, elapsed, *_allocations(func))
+
+
+def bench_async(label: str, coro_func, number: int = 10_000):
+    """Measure ops/sec and allocations of a coroutine function."""
+    async def repeat(count):
+        for _ in range(count):
+            await coro_func()
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(repeat(1))
+        start = time.perf_counter()
+        loop.run_until_complete(repeat(number))
+        elapsed = time.perf_counter() - start
+        _report(label, number, elapsed, *_allocations(lambda: loop.run_until_complete(repeat(1))))
+    finally:
+        loop.close()
@@ -3,7 +3,8 @@ from homeassistant import config_entries, core
 from homeassistant.const import Platform
 from homeassistant.helpers import config_validation as cv
 
-from .const import DOMAIN, DATA_HASS_CONFIG
+from .const import DOMAIN, DATA_DISABLED_DEFAULT_APPLIED, DATA_HASS_CONFIG, DATA_SESSIONS
+from .sessions import SessionTracker
 
 PLATFORMS = [Platform.SENSOR]
 
@@ -39,6 +40,7 @@ async def async_unload_entry(
     """Unload a config entry."""
     if unload_ok := await hass.config_entries.async_unload_platforms(entry, PLATFORMS):
         hass.data[DOMAIN].pop(entry.entry_id, None)
+        hass.data[DOMAIN].pop(f"{entry.entry_id}_metrics", None)
         unsub = hass.data[DOMAIN].pop(f"{entry.entry_id}_unsub_options", None)
         if unsub:
             unsub()
@@ -46,6 +48,18 @@ async def async_unload_entry(
     return unload_ok
 
 
+async def async_remove_entry(
+        hass: core.HomeAssistant, entry: config_entries.ConfigEntry
+) -> None:
+    """Delete the stored sessions of a removed config entry."""
+    # The tracker outlives the unload, an entry removed before it was ever set up only has its store
+    session_tracker = hass.data.get(DATA_SESSIONS, {}).pop(entry.entry_id, None)
+    if session_tracker is None:
+        session_tracker = SessionTracker(hass, entry.entry_id)
+    await session_tracker.async_remove()
+    hass.data.get(DATA_DISABLED_DEFAULT_APPLIED, {}).pop(entry.entry_id, None)
+
+
 async def async_setup(hass: core.HomeAssistant, config: dict) -> bool:
     hass.data.setdefault(DOMAIN, {})
     hass.data[DATA_HASS_CONFIG] = config
@@ -0,0 +1,92 @@
+"""Resolution of the Discord asset URLs shown by the member entities, avatars and activity images."""
+import re
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional
+
+from nextcord import Asset, User
+
+# Resolved URLs kept by AssetUrlResolver, shared by all config entries
+ASSET_URL_CACHE_SIZE = 2048
+
+AVATAR_SIZE = 1024
+
+_PATTERN_WITH_SIZE = re.compile(
+    r'^https://cdn\.discordapp\.com/app-assets/\d+/mp:external/([^/]+)/(https/.+?)(_\d+)\.(?:png|jpg|jpeg|webp)$'
+)
+_PATTERN_NO_SIZE = re.compile(
+    r'^https://cdn\.discordapp\.com/app-assets/\d+/mp:external/([^/]+)/(https/.+?)\.(?:png|jpg|jpeg|webp)$'
+)
+
+
+def to_media_discord_url(url: str) -> str:
+    """Turn a Discord app-assets proxy URL of an external image into its media.discordapp.net URL."""
+    if not url or "mp:external" not in url:
+        return url
+
+    m = _PATTERN_WITH_SIZE.match(url)
+    if m:
+        return f"https://media.discordapp.net/external/{m.group(1)}/{m.group(2)}{m.group(3)}"
+
+    m = _PATTERN_NO_SIZE.match(url)
+    if m:
+        return f"https://media.discordapp.net/external/{m.group(1)}/{m.group(2)}"
+
+    return url
+
+
+def _avatar_url(avatar: Asset, image_format: str) -> str:
+    return str(avatar.with_size(AVATAR_SIZE).with_static_format(image_format))
+
+
+class AssetUrlResolver:
+    """LRU cache of resolved avatar, activity image and Spotify cover URLs.
+
+    The same avatars and images come back with every presence update, each one is resolved once and
+    every member state showing it shares the same string.
+    """
+
+    def __init__(self, max_size: int = ASSET_URL_CACHE_SIZE):
+        self._max_size = max_size
+        self._entries: OrderedDict[Hashable, str] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _resolve(self, key: Hashable, resolve: Callable[..., str], *args) -> str:
+        url = self._entries.get(key)
+        if url is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return url
+
+        self.misses += 1
+        url = self._entries[key] = resolve(*args)
+        if len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+        return url
+
+    def avatar_url(self, user: User, image_format: str) -> str:
+        """Return the avatar URL of a user, the default avatar if the user has none."""
+        if not user.avatar:
+            return user.default_avatar.url
+        avatar = user.display_avatar
+        # The raw URL carries the user id and the asset hash
+        return self._resolve((avatar.key, avatar.url, image_format), _avatar_url, avatar, image_format)
+
+    def media_url(self, url: Optional[str]) -> Optional[str]:
+        """Return the URL an activity image or Spotify cover is shown with, see to_media_discord_url."""
+        if not url:
+            return url
+        return self._resolve(url, to_media_discord_url, url)
+
+    def as_dict(self) -> dict:
+        """Return the resolver diagnostics."""
+        lookups = self.hits + self.misses
+        return {
+            "cached_urls": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+        }
@@ -0,0 +1,49 @@
+"""Coalescing of bursts of gateway events per member."""
+from typing import Any, Awaitable, Callable, Hashable
+
+from homeassistant import core
+
+
+class UpdateCoalescer:
+    """Merge the updates for a key that arrive within a window into one flush on its trailing edge.
+
+    Only the latest payload of a key is kept. The window starts with the first update, so a steady
+    stream of updates is still flushed once per window. A window of 0 flushes every update right away.
+    """
+
+    def __init__(self, hass: core.HomeAssistant, window: float, flush: Callable[[Hashable, Any], Awaitable[None]]):
+        self._hass = hass
+        self._window = window
+        self._flush = flush
+        self._pending: dict[Hashable, Any] = {}
+        self._timers: dict = {}
+
+    async def async_push(self, key: Hashable, payload: Any) -> None:
+        """Queue payload as the latest update for key."""
+        if self._window <= 0:
+            await self._flush(key, payload)
+            return
+        self._pending[key] = payload
+        if key not in self._timers:
+            self._timers[key] = self._hass.loop.call_later(self._window, self._fire, key)
+
+    async def async_flush(self, key: Hashable) -> None:
+        """Flush the pending update for key now, if there is one."""
+        timer = self._timers.pop(key, None)
+        if timer is None:
+            return
+        timer.cancel()
+        await self._flush(key, self._pending.pop(key))
+
+    @core.callback
+    def cancel(self) -> None:
+        """Drop all pending updates."""
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        self._pending.clear()
+
+    @core.callback
+    def _fire(self, key: Hashable) -> None:
+        del self._timers[key]
+        self._hass.async_create_task(self._flush(key, self._pending.pop(key)))
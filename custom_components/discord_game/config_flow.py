@@ -1,18 +1,27 @@
+import asyncio
 import logging
+import time
 from typing import Optional, Dict, Any
 
 import homeassistant.helpers.config_validation as cv
 import nextcord
 import voluptuous as vol
-from homeassistant import config_entries
+from homeassistant import config_entries, core
 from homeassistant.const import CONF_ACCESS_TOKEN
 from homeassistant.helpers import selector
 from nextcord import LoginFailure
+from nextcord.http import Route
 
-from .const import DOMAIN, CONF_MEMBERS, CONF_CHANNELS, CONF_VOICE_CHANNELS, CONF_IMAGE_FORMAT, CONF_STEAM_API_KEY, CONF_ENTITIES_DISABLED_DEFAULT
+from .const import DOMAIN, CONF_MEMBERS, CONF_CHANNELS, CONF_VOICE_CHANNELS, CONF_IMAGE_FORMAT, CONF_STEAM_API_KEY, CONF_ENTITIES_DISABLED_DEFAULT, \
+    CONF_COALESCE_WINDOW, CONF_VOICE_IMMEDIATE, CONF_RECORDER_FRIENDLY, CONF_VOICE_OVERVIEW_GUILDS, CONF_ROLES, CONF_SEARCH, DEFAULT_COALESCE_WINDOW, DATA_FLOW_LISTINGS
 
 _LOGGER = logging.getLogger(__name__)
 
+COALESCE_WINDOW_SELECTOR = selector.NumberSelector(
+    selector.NumberSelectorConfig(min=0, max=5000, step=50, unit_of_measurement="ms",
+                                  mode=selector.NumberSelectorMode.BOX),
+)
+
 AUTH_SCHEMA = vol.Schema(
     {
         vol.Required(CONF_ACCESS_TOKEN): cv.string,
@@ -25,72 +34,157 @@ AUTH_SCHEMA = vol.Schema(
             selector.TextSelectorConfig(type=selector.TextSelectorType.PASSWORD),
         ),
         vol.Required(CONF_ENTITIES_DISABLED_DEFAULT, default=False): selector.BooleanSelector(),
+        vol.Required(CONF_COALESCE_WINDOW, default=DEFAULT_COALESCE_WINDOW): COALESCE_WINDOW_SELECTOR,
+        vol.Required(CONF_VOICE_IMMEDIATE, default=True): selector.BooleanSelector(),
+        vol.Required(CONF_RECORDER_FRIENDLY, default=False): selector.BooleanSelector(),
     }
 )
 
 
-async def _validate_auth_and_fetch_data(token: str):
-    """Authenticate with Discord and fetch guild members and channels.
+# Guild and channel listings are reused by the user/options steps for this long
+LISTING_TTL = 5 * 60  # seconds
+# Results per guild of a member search, the Discord maximum is 1000
+MEMBER_SEARCH_LIMIT = 25
+
+
+class DiscordListing:
+    """Guilds, channels and roles a bot can see, and the members found by the searches so far."""
+
+    def __init__(self, guilds: dict, channels: dict, voice_channels: dict, roles: dict):
+        self.guilds = guilds  # guild id -> name
+        self.channels = channels  # channel id -> name
+        self.voice_channels = voice_channels  # channel id -> name
+        self.roles = roles  # role id -> "guild: role"
+        self.members: dict[int, str] = {}  # user id -> label
+        self.expires = time.monotonic() + LISTING_TTL
+
+
+def _member_label(display_name: str, user_name: str) -> str:
+    return user_name if not display_name or display_name == user_name else f"{display_name} ({user_name})"
+
+
+def _options(names: dict) -> list:
+    return [selector.SelectOptionDict(value=str(object_id), label=name)
+            for object_id, name in sorted(names.items(), key=lambda item: item[1].casefold())]
+
+
+async def _async_get_listing(hass: core.HomeAssistant, token: str) -> DiscordListing:
+    """Return the guilds, channels and roles of the bot, fetched at most once per LISTING_TTL.
 
-    Returns (members_dict, user_names, channels_dict, channel_names).
     Raises ValueError on auth failure.
     """
-    client = nextcord.Client(intents=nextcord.Intents.all())
+    listings: dict = hass.data.setdefault(DATA_FLOW_LISTINGS, {})
+    now = time.monotonic()
+    for cached_token in [t for t, listing in listings.items() if listing.expires <= now]:
+        del listings[cached_token]
+    if token in listings:
+        return listings[token]
+
+    client = nextcord.Client(intents=nextcord.Intents(guilds=True))
     try:
         await client.login(token)
-        guilds_iter = client.fetch_guilds()
-        _LOGGER.debug("fetch_guilds() type: %s, value: %r", type(guilds_iter), guilds_iter)
-        guilds = [g async for g in guilds_iter]
+        guilds = [g async for g in client.fetch_guilds()]
         _LOGGER.debug("guilds (as list): %s", guilds)
-
-        members = {}
         channels = {}
         voice_channels = {}
-
-        for guild in guilds:
-            _members_iter = guild.fetch_members()
-            _LOGGER.debug("fetch_members() type: %s, value: %r", type(_members_iter), _members_iter)
-            _members = [m async for m in _members_iter]
-            _LOGGER.debug("members (as list): %s", _members)
-            for member in _members:
-                members[member.name] = member
-
-            _channels = await guild.fetch_channels()
+        for _channels in await asyncio.gather(*[guild.fetch_channels() for guild in guilds]):
             for channel in _channels:
                 if isinstance(channel, nextcord.VoiceChannel):
-                    voice_channels[channel.name] = channel
+                    voice_channels[channel.id] = channel.name
                 else:
-                    channels[channel.name] = channel
-        _LOGGER.debug("members: %s", members)
+                    channels[channel.id] = channel.name
         _LOGGER.debug("channels: %s", channels)
         _LOGGER.debug("voice_channels: %s", voice_channels)
+        roles = {}
+        for guild, _roles in zip(guilds, await asyncio.gather(*[guild.fetch_roles() for guild in guilds])):
+            for role in _roles:
+                # @everyone has the id of the guild
+                if role.id != guild.id:
+                    roles[role.id] = f"{guild.name}: {role.name}"
+        _LOGGER.debug("roles: %s", roles)
+    except LoginFailure:
+        raise ValueError("Invalid access token")
+    finally:
+        await client.close()
 
-        user_names = list(members.keys())
-        _LOGGER.debug("userNames: %s", user_names)
+    listing = listings[token] = DiscordListing({guild.id: guild.name for guild in guilds}, channels, voice_channels,
+                                               roles)
+    return listing
 
-        channel_names = list(channels.keys())
-        _LOGGER.debug("channelNames: %s", channel_names)
 
-        voice_channel_names = list(voice_channels.keys())
-        _LOGGER.debug("voiceChannelNames: %s", voice_channel_names)
+async def _async_find_members(token: str, listing: DiscordListing, query: str = None, member_ids=()) -> None:
+    """Add the members matching query, and the given members not known yet, to the listing.
 
-        return members, user_names, channels, channel_names, voice_channels, voice_channel_names
-    except LoginFailure:
-        raise ValueError("Invalid access token")
+    Names are searched by Discord (GET /guilds/{guild.id}/members/search), so only the matches are transferred.
+    """
+    missing = [member_id for member_id in member_ids if member_id not in listing.members]
+    if not query and not missing:
+        return
+    client = nextcord.Client(intents=nextcord.Intents(guilds=True))
+    try:
+        await client.login(token)
+        if query:
+            for guild_id in listing.guilds:
+                found = await client.http.request(
+                    Route("GET", "/guilds/{guild_id}/members/search", guild_id=guild_id),
+                    params={"query": query, "limit": MEMBER_SEARCH_LIMIT},
+                )
+                for member in found:
+                    user = member["user"]
+                    listing.members[int(user["id"])] = _member_label(
+                        member.get("nick") or user.get("global_name"), user["username"])
+        for member_id in missing:
+            try:
+                user = await client.fetch_user(member_id)
+                listing.members[member_id] = _member_label(user.global_name, user.name)
+            except nextcord.NotFound:
+                _LOGGER.debug("Configured user %s not found", member_id)
+    except nextcord.HTTPException as err:
+        _LOGGER.warning("Discord member search failed: %s", err)
     finally:
         await client.close()
 
 
+def _members_schema(listing: DiscordListing, members: list, channels: list, voice_channels: list,
+                    voice_overview_guilds: list, roles: list) -> vol.Schema:
+    """Schema of the members step, members lists the selected and found users."""
+    return vol.Schema(
+        {
+            vol.Optional(CONF_SEARCH, default=""): selector.TextSelector(),
+            vol.Optional(CONF_MEMBERS, default=members): selector.SelectSelector(
+                selector.SelectSelectorConfig(options=_options(listing.members),
+                                              multiple=True,
+                                              mode=selector.SelectSelectorMode.DROPDOWN),
+            ),
+            vol.Optional(CONF_CHANNELS, default=channels): selector.SelectSelector(
+                selector.SelectSelectorConfig(options=_options(listing.channels),
+                                              multiple=True,
+                                              mode=selector.SelectSelectorMode.DROPDOWN),
+            ),
+            vol.Optional(CONF_VOICE_CHANNELS, default=voice_channels): selector.SelectSelector(
+                selector.SelectSelectorConfig(options=_options(listing.voice_channels),
+                                              multiple=True,
+                                              mode=selector.SelectSelectorMode.DROPDOWN),
+            ),
+            vol.Optional(CONF_VOICE_OVERVIEW_GUILDS, default=voice_overview_guilds): selector.SelectSelector(
+                selector.SelectSelectorConfig(options=_options(listing.guilds),
+                                              multiple=True,
+                                              mode=selector.SelectSelectorMode.DROPDOWN),
+            ),
+            vol.Optional(CONF_ROLES, default=roles): selector.SelectSelector(
+                selector.SelectSelectorConfig(options=_options(listing.roles),
+                                              multiple=True,
+                                              mode=selector.SelectSelectorMode.DROPDOWN),
+            ),
+        }
+    )
+
+
 class DiscordGameConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
     data: Optional[Dict[str, Any]]
 
     def __init__(self):
-        self.members = {}
-        self.user_names = []
-        self.channels = {}
-        self.channel_names = []
-        self.voice_channels = {}
-        self.voice_channel_names = []
+        self.listing: Optional[DiscordListing] = None
 
     @staticmethod
     def async_get_options_flow(_config_entry):
@@ -100,9 +194,7 @@ class DiscordGameConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
         errors: Dict[str, str] = {}
         if user_input is not None:
             try:
-                self.members, self.user_names, self.channels, self.channel_names, \
-                    self.voice_channels, self.voice_channel_names = \
-                    await _validate_auth_and_fetch_data(user_input[CONF_ACCESS_TOKEN])
+                self.listing = await _async_get_listing(self.hass, user_input[CONF_ACCESS_TOKEN])
             except ValueError:
                 errors["base"] = "auth"
             if not errors:
@@ -110,6 +202,8 @@ class DiscordGameConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
                 self.data[CONF_MEMBERS] = []
                 self.data[CONF_CHANNELS] = []
                 self.data[CONF_VOICE_CHANNELS] = []
+                self.data[CONF_VOICE_OVERVIEW_GUILDS] = []
+                self.data[CONF_ROLES] = []
 
                 return await self.async_step_members()
 
@@ -118,41 +212,30 @@ class DiscordGameConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
         )
 
     async def async_step_members(self, user_input: Optional[Dict[str, Any]] = None):
-        _MEMBERS_SCHEMA = vol.Schema(
-            {
-                vol.Optional(CONF_MEMBERS): selector.SelectSelector(
-                    selector.SelectSelectorConfig(options=self.user_names,
-                                                  multiple=True,
-                                                  mode=selector.SelectSelectorMode.DROPDOWN),
-                ),
-                vol.Optional(CONF_CHANNELS): selector.SelectSelector(
-                    selector.SelectSelectorConfig(options=self.channel_names,
-                                                  multiple=True,
-                                                  mode=selector.SelectSelectorMode.DROPDOWN),
-                ),
-                vol.Optional(CONF_VOICE_CHANNELS): selector.SelectSelector(
-                    selector.SelectSelectorConfig(options=self.voice_channel_names,
-                                                  multiple=True,
-                                                  mode=selector.SelectSelectorMode.DROPDOWN),
-                ),
-            }
-        )
-
         errors: Dict[str, str] = {}
         if user_input is not None:
-            for user in user_input.get(CONF_MEMBERS, []):
-                self.data[CONF_MEMBERS].append(self.members.get(user).id)
-            if user_input.get(CONF_CHANNELS):
-                for channel in user_input.get(CONF_CHANNELS):
-                    self.data[CONF_CHANNELS].append(self.channels.get(channel).id)
-            if user_input.get(CONF_VOICE_CHANNELS):
-                for channel in user_input.get(CONF_VOICE_CHANNELS):
-                    self.data[CONF_VOICE_CHANNELS].append(self.voice_channels.get(channel).id)
+            # A search shows the form again with the matching users added to the choices
+            if query := user_input.get(CONF_SEARCH, "").strip():
+                await _async_find_members(self.data[CONF_ACCESS_TOKEN], self.listing, query)
+                return self.async_show_form(
+                    step_id="members", errors=errors,
+                    data_schema=_members_schema(self.listing, user_input.get(CONF_MEMBERS, []),
+                                                user_input.get(CONF_CHANNELS, []),
+                                                user_input.get(CONF_VOICE_CHANNELS, []),
+                                                user_input.get(CONF_VOICE_OVERVIEW_GUILDS, []),
+                                                user_input.get(CONF_ROLES, [])),
+                )
+
+            self.data[CONF_MEMBERS] = [int(user) for user in user_input.get(CONF_MEMBERS, [])]
+            self.data[CONF_CHANNELS] = [int(channel) for channel in user_input.get(CONF_CHANNELS, [])]
+            self.data[CONF_VOICE_CHANNELS] = [int(channel) for channel in user_input.get(CONF_VOICE_CHANNELS, [])]
+            self.data[CONF_VOICE_OVERVIEW_GUILDS] = [int(guild) for guild in user_input.get(CONF_VOICE_OVERVIEW_GUILDS, [])]
+            self.data[CONF_ROLES] = [int(role) for role in user_input.get(CONF_ROLES, [])]
 
             return self.async_create_entry(title="Discord Game", data=self.data)
 
         return self.async_show_form(
-            step_id="members", data_schema=_MEMBERS_SCHEMA, errors=errors
+            step_id="members", data_schema=_members_schema(self.listing, [], [], [], [], []), errors=errors
         )
 
 
@@ -167,9 +250,7 @@ class DiscordGameOptionsFlow(config_entries.OptionsFlow):
         errors: Dict[str, str] = {}
         if user_input is not None:
             try:
-                self.members, self.user_names, self.channels, self.channel_names, \
-                    self.voice_channels, self.voice_channel_names = \
-                    await _validate_auth_and_fetch_data(user_input[CONF_ACCESS_TOKEN])
+                self.listing = await _async_get_listing(self.hass, user_input[CONF_ACCESS_TOKEN])
             except ValueError:
                 errors["base"] = "auth"
             if not errors:
@@ -177,12 +258,20 @@ class DiscordGameOptionsFlow(config_entries.OptionsFlow):
                 self.options_data[CONF_MEMBERS] = []
                 self.options_data[CONF_CHANNELS] = []
                 self.options_data[CONF_VOICE_CHANNELS] = []
+                self.options_data[CONF_VOICE_OVERVIEW_GUILDS] = []
+                self.options_data[CONF_ROLES] = []
+                # Labels for the users that are already tracked
+                await _async_find_members(user_input[CONF_ACCESS_TOKEN], self.listing,
+                                          member_ids=self._get_current(CONF_MEMBERS, []))
                 return await self.async_step_members()
 
         current_token = self._get_current(CONF_ACCESS_TOKEN)
         current_image_format = self._get_current(CONF_IMAGE_FORMAT, "webp")
         current_steam_key = self._get_current(CONF_STEAM_API_KEY)
         current_entities_disabled = self._get_current(CONF_ENTITIES_DISABLED_DEFAULT, False)
+        current_coalesce_window = self._get_current(CONF_COALESCE_WINDOW, DEFAULT_COALESCE_WINDOW)
+        current_voice_immediate = self._get_current(CONF_VOICE_IMMEDIATE, True)
+        current_recorder_friendly = self._get_current(CONF_RECORDER_FRIENDLY, False)
 
         options_schema = vol.Schema(
             {
@@ -196,67 +285,54 @@ class DiscordGameOptionsFlow(config_entries.OptionsFlow):
                     selector.TextSelectorConfig(type=selector.TextSelectorType.PASSWORD),
                 ),
                 vol.Required(CONF_ENTITIES_DISABLED_DEFAULT, default=current_entities_disabled): selector.BooleanSelector(),
+                vol.Required(CONF_COALESCE_WINDOW, default=current_coalesce_window): COALESCE_WINDOW_SELECTOR,
+                vol.Required(CONF_VOICE_IMMEDIATE, default=current_voice_immediate): selector.BooleanSelector(),
+                vol.Required(CONF_RECORDER_FRIENDLY, default=current_recorder_friendly): selector.BooleanSelector(),
             }
         )
 
         return self.async_show_form(step_id="init", data_schema=options_schema, errors=errors)
 
     async def async_step_members(self, user_input: Optional[Dict[str, Any]] = None):
-        # Build a reverse lookup: ID -> name for pre-selecting current members/channels
-        current_member_ids = set(self._get_current(CONF_MEMBERS, []))
-        current_channel_ids = set(self._get_current(CONF_CHANNELS, []))
-        current_voice_channel_ids = set(self._get_current(CONF_VOICE_CHANNELS, []))
-
-        preselected_members = [
-            name for name, member in self.members.items()
-            if member.id in current_member_ids
-        ]
-        preselected_channels = [
-            name for name, channel in self.channels.items()
-            if channel.id in current_channel_ids
-        ]
-        preselected_voice_channels = [
-            name for name, channel in self.voice_channels.items()
-            if channel.id in current_voice_channel_ids
-        ]
-
-        _MEMBERS_SCHEMA = vol.Schema(
-            {
-                vol.Optional(CONF_MEMBERS, default=preselected_members): selector.SelectSelector(
-                    selector.SelectSelectorConfig(options=self.user_names,
-                                                  multiple=True,
-                                                  mode=selector.SelectSelectorMode.DROPDOWN),
-                ),
-                vol.Optional(CONF_CHANNELS, default=preselected_channels): selector.SelectSelector(
-                    selector.SelectSelectorConfig(options=self.channel_names,
-                                                  multiple=True,
-                                                  mode=selector.SelectSelectorMode.DROPDOWN),
-                ),
-                vol.Optional(CONF_VOICE_CHANNELS, default=preselected_voice_channels): selector.SelectSelector(
-                    selector.SelectSelectorConfig(options=self.voice_channel_names,
-                                                  multiple=True,
-                                                  mode=selector.SelectSelectorMode.DROPDOWN),
-                ),
-            }
-        )
-
         errors: Dict[str, str] = {}
         if user_input is not None:
-            for user in user_input.get(CONF_MEMBERS, []):
-                member = self.members.get(user)
-                if member:
-                    self.options_data[CONF_MEMBERS].append(member.id)
-            for channel in user_input.get(CONF_CHANNELS, []):
-                ch = self.channels.get(channel)
-                if ch:
-                    self.options_data[CONF_CHANNELS].append(ch.id)
-            for channel in user_input.get(CONF_VOICE_CHANNELS, []):
-                ch = self.voice_channels.get(channel)
-                if ch:
-                    self.options_data[CONF_VOICE_CHANNELS].append(ch.id)
+            # A search shows the form again with the matching users added to the choices
+            if query := user_input.get(CONF_SEARCH, "").strip():
+                await _async_find_members(self.options_data[CONF_ACCESS_TOKEN], self.listing, query)
+                return self.async_show_form(
+                    step_id="members", errors=errors,
+                    data_schema=_members_schema(self.listing, user_input.get(CONF_MEMBERS, []),
+                                                user_input.get(CONF_CHANNELS, []),
+                                                user_input.get(CONF_VOICE_CHANNELS, []),
+                                                user_input.get(CONF_VOICE_OVERVIEW_GUILDS, []),
+                                                user_input.get(CONF_ROLES, [])),
+                )
+
+            self.options_data[CONF_MEMBERS] = [int(user) for user in user_input.get(CONF_MEMBERS, [])]
+            self.options_data[CONF_CHANNELS] = [int(channel) for channel in user_input.get(CONF_CHANNELS, [])]
+            self.options_data[CONF_VOICE_CHANNELS] = [int(channel) for channel in user_input.get(CONF_VOICE_CHANNELS, [])]
+            self.options_data[CONF_VOICE_OVERVIEW_GUILDS] = [
+                int(guild) for guild in user_input.get(CONF_VOICE_OVERVIEW_GUILDS, [])
+            ]
+            self.options_data[CONF_ROLES] = [int(role) for role in user_input.get(CONF_ROLES, [])]
 
             return self.async_create_entry(title="", data=self.options_data)
 
+        # Pre-select the current members/channels that the bot can still see
+        preselected_members = [str(member_id) for member_id in self._get_current(CONF_MEMBERS, [])
+                               if member_id in self.listing.members]
+        preselected_channels = [str(channel_id) for channel_id in self._get_current(CONF_CHANNELS, [])
+                                if channel_id in self.listing.channels]
+        preselected_voice_channels = [str(channel_id) for channel_id in self._get_current(CONF_VOICE_CHANNELS, [])
+                                      if channel_id in self.listing.voice_channels]
+        preselected_voice_overview_guilds = [str(guild_id) for guild_id in self._get_current(CONF_VOICE_OVERVIEW_GUILDS, [])
+                                             if guild_id in self.listing.guilds]
+        preselected_roles = [str(role_id) for role_id in self._get_current(CONF_ROLES, [])
+                             if role_id in self.listing.roles]
+
         return self.async_show_form(
-            step_id="members", data_schema=_MEMBERS_SCHEMA, errors=errors
+            step_id="members", errors=errors,
+            data_schema=_members_schema(self.listing, preselected_members, preselected_channels,
+                                        preselected_voice_channels, preselected_voice_overview_guilds,
+                                        preselected_roles),
         )
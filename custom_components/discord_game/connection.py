@@ -0,0 +1,512 @@
+"""Discord gateway connections shared by the config entries that use the same bot token."""
+import asyncio
+import logging
+
+import nextcord
+from homeassistant import core
+from homeassistant.const import EVENT_HOMEASSISTANT_STOP
+from homeassistant.helpers.event import async_call_later
+from nextcord import Member, User, VoiceState, RawReactionActionEvent
+from nextcord.ext import tasks
+
+from .const import DOMAIN, DATA_CONNECTIONS, DATA_STEAM_CATALOG
+from .metrics import IntegrationMetrics
+
+_LOGGER = logging.getLogger(__name__)
+
+# Users per gateway member request, the Discord maximum
+MEMBER_QUERY_SIZE = 100
+
+RECONNECT_DELAY = 10  # seconds
+RECONNECT_MAX_DELAY = 300  # seconds
+
+# The member lists of guilds with tracked roles are searched again this often, Discord only sends updates
+# of cached members, so members who get a tracked role are found this way
+ROLE_MEMBERS_REFRESH_INTERVAL = 6 * 60 * 60  # seconds
+
+# Entities stay available this long after the gateway connection dropped, a reconnect within it only
+# writes what changed meanwhile
+DISCONNECT_GRACE_PERIOD = 60  # seconds
+
+
+def bot_options(members: bool, channels: bool, voice_channels: bool, voice_guilds: bool = False,
+                roles: bool = False) -> dict:
+    """Return the nextcord.Client gateway and cache options for what the attached config entries track.
+
+    Only the intents of the tracked events are requested, guilds are not chunked and messages are not cached.
+    Members are not cached when they show up either: the watched members are requested into the cache on
+    connect, and members in voice are cached only while voice channels are tracked. Guild voice overviews
+    only need the voice states, which nextcord keeps whether or not their members are cached. Members of
+    tracked roles are requested into the cache on connect as well, presences of uncached members are dropped.
+    """
+    intents = nextcord.Intents.none()
+    intents.guilds = True
+    intents.members = members or roles
+    intents.presences = members or roles
+    intents.voice_states = members or voice_channels or voice_guilds or roles
+    intents.guild_reactions = channels
+    return {
+        "intents": intents,
+        "member_cache_flags": nextcord.MemberCacheFlags(voice=voice_channels, joined=False),
+        "chunk_guilds_at_startup": False,
+        "max_messages": None,
+    }
+
+
+class Subscription:
+    """What a config entry tracks on a connection and the handlers its events are routed to.
+
+    Handlers are coroutine functions named after the nextcord events they receive, minus the event
+    arguments the connection already used for routing: on_ready(), on_disconnect(), on_resumed(),
+    on_member_update(member), on_presence_update(member), on_user_update(user),
+    on_voice_state_update(member, before, after) and on_raw_reaction_add(payload). Every voice state
+    update of a guild in voice_guild_ids also goes to on_guild_voice_state_update(member, before, after).
+    on_disconnect() only comes once the connection has been down for DISCONNECT_GRACE_PERIOD, a reconnect
+    within it just brings on_ready() or on_resumed().
+    Members that have or had a role in role_ids have their updates routed to on_role_member_update(before,
+    after), on_role_presence_update(member), on_role_voice_state_update(member, before, after) and
+    on_role_member_remove(member).
+    """
+
+    def __init__(self, metrics: IntegrationMetrics, member_ids, channel_ids, voice_channel_ids,
+                 steam_api_key: str = None, voice_guild_ids=(), role_ids=(), **handlers):
+        self.metrics = metrics
+        self.member_ids = frozenset(int(member_id) for member_id in member_ids)
+        self.channel_ids = frozenset(int(channel_id) for channel_id in channel_ids)
+        self.voice_channel_ids = frozenset(int(channel_id) for channel_id in voice_channel_ids)
+        self.voice_guild_ids = frozenset(int(guild_id) for guild_id in voice_guild_ids)
+        self.role_ids = frozenset(int(role_id) for role_id in role_ids)
+        self.steam_api_key = steam_api_key
+        self.handlers = handlers
+        self.ready = False
+
+    async def async_dispatch(self, event: str, *args) -> None:
+        handler = self.handlers.get(event)
+        if handler is not None:
+            await handler(*args)
+
+
+@core.callback
+def async_get_connection(hass: core.HomeAssistant, token: str) -> "DiscordConnection":
+    """Return the connection of the bot token, created on first use."""
+    connections = hass.data[DOMAIN].setdefault(DATA_CONNECTIONS, {})
+    connection = connections.get(token)
+    if connection is None:
+        connection = connections[token] = DiscordConnection(hass, token)
+    return connection
+
+
+class DiscordConnection:
+    """Reference-counted gateway connection of one bot token.
+
+    Config entries attach a Subscription and detach it on unload, the last one closes the connection.
+    Gateway events are routed to the subscriptions tracking the member or channel through ID indexes,
+    so every entry only sees its own events and the bot keeps one gateway session, one member cache
+    and one Steam catalog refresh loop.
+    """
+
+    def __init__(self, hass: core.HomeAssistant, token: str):
+        self._hass = hass
+        self._token = token
+        self._lock = asyncio.Lock()
+        self._subscriptions: dict[str, Subscription] = {}
+        self._by_member: dict[int, list[Subscription]] = {}
+        self._by_channel: dict[int, list[Subscription]] = {}
+        self._by_voice_channel: dict[int, list[Subscription]] = {}
+        self._by_voice_guild: dict[int, list[Subscription]] = {}
+        self._by_role: dict[int, list[Subscription]] = {}
+        # Guild ID -> IDs of its members with a tracked role, and the roles its member list was searched for
+        self._role_member_ids: dict[int, set[int]] = {}
+        self._listed_role_ids: dict[int, frozenset[int]] = {}
+        self._options = None
+        self._task: asyncio.Task = None
+        self._unsub_stop = None
+        self._shutting_down = False
+        self._unsub_grace = None
+        self.client: nextcord.Client = None
+        self.connected = False
+        # What the entities show, lags behind connected by up to DISCONNECT_GRACE_PERIOD after a disconnect.
+        # Starting counts as a disconnect, entities show their restored state while the bot connects.
+        self.available = True
+        self._refresh_steam_catalog = tasks.loop(hours=1)(self._async_refresh_steam_catalog)
+        self._refresh_role_members = tasks.loop(seconds=ROLE_MEMBERS_REFRESH_INTERVAL)(self._async_refresh_role_members)
+
+    def __len__(self):
+        return len(self._subscriptions)
+
+    def as_dict(self) -> dict:
+        """Return the connection diagnostics."""
+        return {
+            "connected": self.connected,
+            "available": self.available,
+            "entries": len(self),
+            "tracked_members": len(self._by_member),
+            "tracked_channels": len(self._by_channel),
+            "tracked_voice_channels": len(self._by_voice_channel),
+            "tracked_voice_guilds": len(self._by_voice_guild),
+            "tracked_roles": len(self._by_role),
+            "cached_members": sum(len(guild.members) for guild in self.client.guilds) if self.client else 0,
+        }
+
+    async def async_attach(self, entry_id: str, subscription: Subscription) -> nextcord.Client:
+        """Attach a config entry, return the logged in client to resolve its users and channels with."""
+        async with self._lock:
+            # A reloaded entry may attach after its previous subscription closed the connection
+            self._hass.data[DOMAIN].setdefault(DATA_CONNECTIONS, {}).setdefault(self._token, self)
+            self._subscriptions[entry_id] = subscription
+            self._build_indexes()
+            if self.client is None:
+                await self._async_new_client()
+            if not self._refresh_steam_catalog.is_running():
+                self._refresh_steam_catalog.start()
+            if not self._refresh_role_members.is_running():
+                self._refresh_role_members.start()
+            return self.client
+
+    async def async_detach(self, entry_id: str, subscription: Subscription) -> None:
+        """Detach the subscription of a config entry, the last one closes the connection."""
+        async with self._lock:
+            # The entry may have been set up again and attached a new subscription already
+            if self._subscriptions.get(entry_id) is subscription:
+                del self._subscriptions[entry_id]
+                self._build_indexes()
+            # The roles are searched for again when the entry is set up again, even if other entries keep the
+            # connection up
+            for guild_id, listed_role_ids in self._listed_role_ids.items():
+                self._listed_role_ids[guild_id] = listed_role_ids - subscription.role_ids
+            if self._subscriptions:
+                return
+            self._hass.data[DOMAIN].get(DATA_CONNECTIONS, {}).pop(self._token, None)
+            self._refresh_steam_catalog.cancel()
+            self._refresh_role_members.cancel()
+            if self._unsub_stop is not None:
+                self._unsub_stop()
+                self._unsub_stop = None
+            await self._async_close()
+            self._cancel_grace()
+            self._role_member_ids.clear()
+            self._listed_role_ids.clear()
+
+    async def async_start(self, entry_id: str) -> None:
+        """Connect to the gateway once an entry has added its entities.
+
+        Connecting again is only needed when the entry tracks something the current intents or member cache
+        don't cover. An entry attaching to a connection that is already up gets its members cached and its
+        on_ready right away.
+        """
+        async with self._lock:
+            if self._options != self._needed_options():
+                await self._async_close()
+                await self._async_new_client()
+            if self._task is None:
+                # Until the first on_ready the entities are in the grace period
+                self._async_disconnected()
+                if self._unsub_stop is None:
+                    self._unsub_stop = self._hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, self._async_stop)
+                self._start()
+                return
+            subscription = self._subscriptions.get(entry_id)
+            if self.connected and subscription is not None and not subscription.ready:
+                await self._async_cache_members(subscription.member_ids, subscription.voice_channel_ids,
+                                                subscription.role_ids)
+                await self._async_ready(subscription)
+
+    def _needed_options(self) -> dict:
+        subscriptions = self._subscriptions.values()
+        return bot_options(any(s.member_ids for s in subscriptions), any(s.channel_ids for s in subscriptions),
+                           any(s.voice_channel_ids for s in subscriptions), any(s.voice_guild_ids for s in subscriptions),
+                           any(s.role_ids for s in subscriptions))
+
+    def _build_indexes(self) -> None:
+        by_member, by_channel, by_voice_channel, by_voice_guild, by_role = {}, {}, {}, {}, {}
+        for subscription in self._subscriptions.values():
+            for member_id in subscription.member_ids:
+                by_member.setdefault(member_id, []).append(subscription)
+            for channel_id in subscription.channel_ids:
+                by_channel.setdefault(channel_id, []).append(subscription)
+            for channel_id in subscription.voice_channel_ids:
+                by_voice_channel.setdefault(channel_id, []).append(subscription)
+            for guild_id in subscription.voice_guild_ids:
+                by_voice_guild.setdefault(guild_id, []).append(subscription)
+            for role_id in subscription.role_ids:
+                by_role.setdefault(role_id, []).append(subscription)
+        self._by_member, self._by_channel, self._by_voice_channel = by_member, by_channel, by_voice_channel
+        self._by_voice_guild, self._by_role = by_voice_guild, by_role
+
+    async def _async_new_client(self) -> None:
+        self._options = self._needed_options()
+        client = nextcord.Client(loop=self._hass.loop, **self._options)
+        self._register_events(client)
+        await client.login(self._token)
+        self.client = client
+
+    async def _async_close(self) -> None:
+        client, task = self.client, self._task
+        self.client, self._task, self._options = None, None, None
+        if task is not None:
+            # The done callback of a replaced or closed client must not reconnect it
+            task.remove_done_callback(self._task_done)
+        if client is not None:
+            await client.close()
+        if self.connected:
+            self._async_disconnected()
+
+    @core.callback
+    def _async_disconnected(self) -> None:
+        """Note that the gateway connection is down, the subscriptions hear of it once the grace period is over."""
+        self.connected = False
+        # Entities keep their state on shutdown, that is the state restored on the next start
+        if not self.available or self._unsub_grace is not None or self._shutting_down:
+            return
+        self._unsub_grace = async_call_later(self._hass, DISCONNECT_GRACE_PERIOD, self._async_grace_expired)
+
+    # noinspection PyUnusedLocal
+    async def _async_grace_expired(self, now) -> None:
+        self._unsub_grace = None
+        if not self.connected and self.available:
+            self.available = False
+            await self._async_broadcast("on_disconnect")
+
+    @core.callback
+    def _async_connected(self) -> None:
+        self.connected = True
+        self.available = True
+        self._cancel_grace()
+
+    def _cancel_grace(self) -> None:
+        if self._unsub_grace is not None:
+            self._unsub_grace()
+            self._unsub_grace = None
+
+    # noinspection PyUnusedLocal
+    async def _async_stop(self, event) -> None:
+        self._shutting_down = True
+        self._unsub_stop = None
+        if self.client is not None:
+            await self.client.close()
+
+    def _start(self) -> None:
+        self._task = asyncio.create_task(self.client.start(self._token))
+        self._task.add_done_callback(self._task_done)
+
+    def _task_done(self, task: asyncio.Task) -> None:
+        self._async_disconnected()
+        if self._shutting_down:
+            _LOGGER.debug("Discord bot stopped (shutdown requested)")
+            return
+        exc = task.exception() if not task.cancelled() else None
+        if exc:
+            _LOGGER.error("Discord bot task failed with error: %s", exc)
+        else:
+            _LOGGER.warning("Discord bot task ended unexpectedly")
+        asyncio.ensure_future(self._async_reconnect(task))
+
+    async def _async_reconnect(self, failed_task: asyncio.Task) -> None:
+        """Reconnect the bot with exponential backoff."""
+        delay = RECONNECT_DELAY
+        while not self._shutting_down and self._task is failed_task:
+            _LOGGER.info("Attempting to reconnect Discord bot in %s seconds...", delay)
+            await asyncio.sleep(delay)
+            if self._shutting_down or self._task is not failed_task:
+                break
+            try:
+                _LOGGER.info("Reconnecting Discord bot...")
+                self._start()
+                for subscription in self._subscriptions.values():
+                    subscription.metrics.reconnects += 1
+                return
+            except Exception as err:
+                _LOGGER.error("Failed to reconnect Discord bot: %s", err)
+                delay = min(delay * 2, RECONNECT_MAX_DELAY)
+
+    async def _async_refresh_steam_catalog(self) -> None:
+        # The stored catalog makes lookups work right away, the download only runs when it is stale
+        steam_catalog = self._hass.data.get(DATA_STEAM_CATALOG)
+        if steam_catalog is None:
+            return
+        await steam_catalog.async_load()
+        steam_api_key = next((s.steam_api_key for s in self._subscriptions.values() if s.steam_api_key), None)
+        if not steam_api_key:
+            _LOGGER.warning("Steam API key not configured, skipping Steam app list loading")
+            return
+        await steam_catalog.async_refresh(steam_api_key)
+
+    async def _async_refresh_role_members(self) -> None:
+        """Search the member lists of the guilds with tracked roles again, for members who got a role since."""
+        # The first run is on start, the role members are listed by on_ready then
+        if self._refresh_role_members.current_loop == 0 or not self.connected or not self._by_role:
+            return
+        for guild in self.client.guilds:
+            known_ids = self._role_member_ids.get(guild.id)
+            if known_ids is None:
+                continue
+            self._listed_role_ids.pop(guild.id, None)
+            guild_role_ids = {role_id for role_id in self._by_role if guild.get_role(role_id) is not None}
+            new_ids = sorted(await self._async_role_member_ids(guild, guild_role_ids) - known_ids)
+            for i in range(0, len(new_ids), MEMBER_QUERY_SIZE):
+                try:
+                    members = await guild.query_members(user_ids=new_ids[i:i + MEMBER_QUERY_SIZE], presences=True,
+                                                        cache=True)
+                except (asyncio.TimeoutError, nextcord.ClientException) as err:
+                    _LOGGER.warning("Could not load role members of guild %s: %s", guild.name, err)
+                    continue
+                for member in members:
+                    await self._async_route(self._role_subscriptions(member), "on_role_presence_update", member)
+
+    async def _async_broadcast(self, event: str, *args) -> None:
+        for subscription in list(self._subscriptions.values()):
+            await subscription.async_dispatch(event, *args)
+
+    @staticmethod
+    async def _async_route(subscriptions, event: str, *args) -> None:
+        for subscription in subscriptions:
+            await subscription.async_dispatch(event, *args)
+
+    async def _async_ready(self, subscription: Subscription) -> None:
+        subscription.ready = True
+        await subscription.async_dispatch("on_ready")
+
+    def _role_subscriptions(self, member: Member) -> list:
+        """Return the subscriptions tracking a role of the member."""
+        subscriptions = []
+        for role in member.roles:
+            subscriptions.extend(s for s in self._by_role.get(role.id, ()) if s not in subscriptions)
+        return subscriptions
+
+    def _has_tracked_role(self, member: Member) -> bool:
+        return any(role.id in self._by_role for role in member.roles)
+
+    def _sync_role_member(self, member: Member) -> None:
+        """Keep the role member IDs of the guild of a member in step with the roles it has now."""
+        role_member_ids = self._role_member_ids.get(member.guild.id)
+        if role_member_ids is None:
+            return
+        if self._has_tracked_role(member):
+            role_member_ids.add(member.id)
+        else:
+            role_member_ids.discard(member.id)
+
+    async def _async_role_member_ids(self, guild: nextcord.Guild, guild_role_ids: set) -> set:
+        """Return the IDs of the members of a guild with a tracked role.
+
+        The gateway can't look members up by role, so the member list of the guild is searched, but only
+        once per set of roles. Member updates and removals keep the IDs current after that.
+        """
+        if guild_role_ids <= self._listed_role_ids.get(guild.id, frozenset()):
+            return self._role_member_ids[guild.id]
+        role_member_ids = set()
+        try:
+            async for member in guild.fetch_members(limit=None):
+                if any(role.id in guild_role_ids for role in member.roles):
+                    role_member_ids.add(member.id)
+        except nextcord.HTTPException as err:
+            _LOGGER.warning("Could not list the role members of guild %s: %s", guild.name, err)
+            return role_member_ids
+        self._role_member_ids[guild.id] = role_member_ids
+        self._listed_role_ids[guild.id] = frozenset(guild_role_ids)
+        return role_member_ids
+
+    async def _async_cache_members(self, member_ids, voice_channel_ids, role_ids=()) -> None:
+        """Request the watched members, the members in tracked voice channels and the members of tracked roles
+        into the member cache.
+        """
+        for guild in self.client.guilds:
+            user_ids = set(member_ids)
+            for channel_id in voice_channel_ids:
+                vc = guild.get_channel(channel_id)
+                if vc is not None:
+                    user_ids.update(vc.voice_states)
+            guild_role_ids = {role_id for role_id in role_ids if guild.get_role(role_id) is not None}
+            if guild_role_ids:
+                user_ids.update(await self._async_role_member_ids(guild, guild_role_ids))
+            user_ids = sorted(user_ids)
+            for i in range(0, len(user_ids), MEMBER_QUERY_SIZE):
+                try:
+                    members = await guild.query_members(user_ids=user_ids[i:i + MEMBER_QUERY_SIZE],
+                                                        presences=bool(member_ids or guild_role_ids), cache=True)
+                except (asyncio.TimeoutError, nextcord.ClientException) as err:
+                    _LOGGER.warning("Could not load members of guild %s: %s", guild.name, err)
+                    continue
+                # Role changes and departures while disconnected show up in the answer
+                for member in members:
+                    self._sync_role_member(member)
+                if guild.id in self._role_member_ids:
+                    self._role_member_ids[guild.id].difference_update(
+                        set(user_ids[i:i + MEMBER_QUERY_SIZE]) - {member.id for member in members})
+
+    def _register_events(self, client: nextcord.Client) -> None:
+        # noinspection PyUnusedLocal
+        @client.event
+        async def on_error(error, *args, **kwargs):
+            _LOGGER.error("Discord bot error in %s: %s", error, args)
+
+        @client.event
+        async def on_ready():
+            self._async_connected()
+            _LOGGER.info("Discord bot connected (on_ready)")
+            await self._async_cache_members(self._by_member, self._by_voice_channel, self._by_role)
+            for subscription in list(self._subscriptions.values()):
+                await self._async_ready(subscription)
+
+        @client.event
+        async def on_disconnect():
+            if self.connected:
+                _LOGGER.warning("Discord bot disconnected")
+                self._async_disconnected()
+
+        @client.event
+        async def on_resumed():
+            if not self.connected:
+                self._async_connected()
+                _LOGGER.info("Discord bot resumed connection")
+                for subscription in self._subscriptions.values():
+                    subscription.metrics.resumes += 1
+                await self._async_broadcast("on_resumed")
+
+        @client.event
+        async def on_member_update(before: Member, after: Member):
+            await self._async_route(self._by_member.get(after.id, ()), "on_member_update", after)
+            if self._by_role:
+                self._sync_role_member(after)
+                # Both sides, so the subscriptions of a role the member lost see it too
+                subscriptions = self._role_subscriptions(before)
+                subscriptions.extend(s for s in self._role_subscriptions(after) if s not in subscriptions)
+                await self._async_route(subscriptions, "on_role_member_update", before, after)
+
+        # noinspection PyUnusedLocal
+        @client.event
+        async def on_presence_update(before: Member, after: Member):
+            await self._async_route(self._by_member.get(after.id, ()), "on_presence_update", after)
+            if self._by_role:
+                await self._async_route(self._role_subscriptions(after), "on_role_presence_update", after)
+
+        @client.event
+        async def on_member_remove(member: Member):
+            if self._by_role:
+                self._role_member_ids.get(member.guild.id, set()).discard(member.id)
+                await self._async_route(self._role_subscriptions(member), "on_role_member_remove", member)
+
+        # noinspection PyUnusedLocal
+        @client.event
+        async def on_user_update(before: User, after: User):
+            await self._async_route(self._by_member.get(after.id, ()), "on_user_update", after)
+
+        @client.event
+        async def on_voice_state_update(member: Member, before: VoiceState, after: VoiceState):
+            watched = self._by_member.get(member.id, ())
+            role_subscriptions = self._role_subscriptions(member) if self._by_role else []
+            if (watched or role_subscriptions) and after.channel is None and member.guild.get_member(member.id) is None:
+                # nextcord drops members that leave voice from the voice-only member cache, get the tracked one back
+                self._hass.async_create_task(member.guild.query_members(user_ids=[member.id], presences=True, cache=True))
+            subscriptions = list(watched)
+            for channel in (before.channel, after.channel):
+                if channel is not None:
+                    subscriptions.extend(s for s in self._by_voice_channel.get(channel.id, ()) if s not in subscriptions)
+            await self._async_route(subscriptions, "on_voice_state_update", member, before, after)
+            await self._async_route(self._by_voice_guild.get(member.guild.id, ()), "on_guild_voice_state_update",
+                                    member, before, after)
+            await self._async_route(role_subscriptions, "on_role_voice_state_update", member, before, after)
+
+        @client.event
+        async def on_raw_reaction_add(payload: RawReactionActionEvent):
+            await self._async_route(self._by_channel.get(payload.channel_id, ()), "on_raw_reaction_add", payload)
@@ -2,7 +2,21 @@ DOMAIN = "discord_game"
 CONF_MEMBERS = 'members'
 CONF_CHANNELS = 'channels'
 CONF_VOICE_CHANNELS = 'voice_channels'
+CONF_VOICE_OVERVIEW_GUILDS = 'voice_overview_guilds'
+CONF_ROLES = 'roles'
 CONF_IMAGE_FORMAT = 'image_format'
 CONF_STEAM_API_KEY = 'steam_api_key'
 CONF_ENTITIES_DISABLED_DEFAULT = 'entities_disabled_default'
+CONF_COALESCE_WINDOW = 'coalesce_window'
+CONF_VOICE_IMMEDIATE = 'voice_immediate'
+CONF_RECORDER_FRIENDLY = 'recorder_friendly'
+CONF_SEARCH = 'search'
+DEFAULT_COALESCE_WINDOW = 250  # milliseconds
+DATA_ASSET_URLS = "discord_game_asset_urls"
+DATA_CONNECTIONS = "connections"
+DATA_DISABLED_DEFAULT_APPLIED = "discord_game_disabled_default_applied"
+DATA_FLOW_LISTINGS = "discord_game_flow_listings"
 DATA_HASS_CONFIG = "discord_game_hass_config"
+DATA_SESSIONS = "discord_game_sessions"
+DATA_STEAM_ARTWORK = "discord_game_steam_artwork"
+DATA_STEAM_CATALOG = "discord_game_steam_catalog"
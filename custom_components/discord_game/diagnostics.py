@@ -0,0 +1,31 @@
+"""Diagnostics support for Discord Game."""
+from typing import Any
+
+from homeassistant import config_entries, core
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.const import CONF_ACCESS_TOKEN
+
+from .const import DOMAIN, CONF_STEAM_API_KEY, DATA_ASSET_URLS, DATA_CONNECTIONS, DATA_STEAM_ARTWORK, DATA_STEAM_CATALOG
+
+TO_REDACT = {CONF_ACCESS_TOKEN, CONF_STEAM_API_KEY}
+
+
+async def async_get_config_entry_diagnostics(
+        hass: core.HomeAssistant, entry: config_entries.ConfigEntry
+) -> dict[str, Any]:
+    """Return diagnostics for a config entry."""
+    metrics = hass.data[DOMAIN].get(f"{entry.entry_id}_metrics")
+    steam_catalog = hass.data.get(DATA_STEAM_CATALOG)
+    steam_artwork = hass.data.get(DATA_STEAM_ARTWORK)
+    asset_urls = hass.data.get(DATA_ASSET_URLS)
+    # The options flow can change the token, the merged config has the one the entry connected with
+    config = hass.data[DOMAIN].get(entry.entry_id, {**entry.data, **entry.options})
+    connection = hass.data[DOMAIN].get(DATA_CONNECTIONS, {}).get(config.get(CONF_ACCESS_TOKEN))
+    return {
+        "config": async_redact_data(config, TO_REDACT),
+        "metrics": metrics.as_dict() if metrics is not None else None,
+        "connection": connection.as_dict() if connection is not None else None,
+        "steam_catalog": steam_catalog.as_dict() if steam_catalog is not None else None,
+        "steam_artwork": steam_artwork.as_dict() if steam_artwork is not None else None,
+        "asset_urls": asset_urls.as_dict() if asset_urls is not None else None,
+    }
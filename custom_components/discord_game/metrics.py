@@ -0,0 +1,81 @@
+"""Performance counters of a config entry, cheap enough to update on every gateway event."""
+import time
+from bisect import bisect_left
+from functools import wraps
+
+# Upper bounds of the handler latency histogram buckets, in milliseconds
+LATENCY_BUCKETS = (1, 5, 25, 100, 500, 2500)
+
+
+class HandlerStats:
+    """Call count and latency histogram of one event handler."""
+
+    __slots__ = ("count", "total", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def record(self, elapsed_ms: float) -> None:
+        self.count += 1
+        self.total += elapsed_ms
+        if elapsed_ms > self.max:
+            self.max = elapsed_ms
+        self.buckets[bisect_left(LATENCY_BUCKETS, elapsed_ms)] += 1
+
+    def as_dict(self) -> dict:
+        labels = [f"<={bound}ms" for bound in LATENCY_BUCKETS] + [f">{LATENCY_BUCKETS[-1]}ms"]
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total / self.count, 3) if self.count else None,
+            "max_ms": round(self.max, 3),
+            "histogram": dict(zip(labels, self.buckets)),
+        }
+
+
+class IntegrationMetrics:
+    """Gateway events, handler latencies, state writes and reconnects of a config entry."""
+
+    def __init__(self):
+        self.started = time.time()
+        self.handlers: dict[str, HandlerStats] = {}
+        self.state_writes = 0
+        self.reconnects = 0
+        self.resumes = 0
+
+    @property
+    def events(self) -> int:
+        """Number of gateway events handled, the on_* handlers."""
+        return sum(stats.count for name, stats in self.handlers.items() if name.startswith("on_"))
+
+    def record(self, name: str, elapsed_ms: float) -> None:
+        stats = self.handlers.get(name)
+        if stats is None:
+            stats = self.handlers[name] = HandlerStats()
+        stats.record(elapsed_ms)
+
+    def timed(self, handler):
+        """Decorate an async event handler so its calls and latency are recorded under its name."""
+        name = handler.__name__
+
+        @wraps(handler)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await handler(*args, **kwargs)
+            finally:
+                self.record(name, (time.perf_counter() - start) * 1000)
+
+        return wrapper
+
+    def as_dict(self) -> dict:
+        return {
+            "uptime_s": round(time.time() - self.started),
+            "events": self.events,
+            "state_writes": self.state_writes,
+            "reconnects": self.reconnects,
+            "resumes": self.resumes,
+            "handlers": {name: stats.as_dict() for name, stats in sorted(self.handlers.items())},
+        }
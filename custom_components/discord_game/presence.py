@@ -0,0 +1,252 @@
+"""Compact, immutable records of what a watched member is doing.
+
+A presence is split into sub-records (game, Spotify, listening, streaming, watching, custom status and
+voice) that are replaced as units, so an update that only changes the voice state keeps the other
+records and their flattened sensor values as they were.
+"""
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import ClassVar, Mapping, Optional
+
+from nextcord import Activity, ActivityType, CustomActivity, Member, Spotify, Streaming, VoiceState
+
+from .assets import AssetUrlResolver
+from .steam import STEAM_IMAGES, SteamAppCatalog, SteamArtworkCache
+
+_LOGGER = logging.getLogger(__name__)
+
+_NO_ARTWORK: Mapping[str, str] = {}
+
+
+@dataclass(slots=True, frozen=True)
+class _Record:
+    # Sensor attribute of each field, in field order
+    SENSOR_ATTRS: ClassVar[tuple] = ()
+
+    def values(self) -> dict:
+        return dict(zip(self.SENSOR_ATTRS, (getattr(self, name) for name in self.__slots__)))
+
+    @classmethod
+    def empty_values(cls) -> dict:
+        return dict.fromkeys(cls.SENSOR_ATTRS)
+
+
+@dataclass(slots=True, frozen=True)
+class GameRecord(_Record):
+    SENSOR_ATTRS: ClassVar[tuple] = ("game", "game_state", "game_details", "game_image_small", "game_image_large",
+                                     "game_image_small_text", "game_image_large_text")
+
+    name: str
+    state: Optional[str] = None
+    details: Optional[str] = None
+    image_small: Optional[str] = None
+    image_large: Optional[str] = None
+    image_small_text: Optional[str] = None
+    image_large_text: Optional[str] = None
+    # Steam artwork {attribute: url}, shared with the artwork cache
+    artwork: Optional[Mapping[str, str]] = None
+    appid: Optional[int] = None
+
+    def values(self) -> dict:
+        values = dict(zip(self.SENSOR_ATTRS, (self.name, self.state, self.details, self.image_small,
+                                              self.image_large, self.image_small_text, self.image_large_text)))
+        artwork = self.artwork or _NO_ARTWORK
+        for attr in STEAM_IMAGES:
+            values[attr] = artwork.get(attr)
+        return values
+
+    @classmethod
+    def empty_values(cls) -> dict:
+        return dict.fromkeys((*cls.SENSOR_ATTRS, *STEAM_IMAGES))
+
+
+@dataclass(slots=True, frozen=True)
+class SpotifyRecord(_Record):
+    SENSOR_ATTRS: ClassVar[tuple] = ("spotify_title", "spotify_artists", "spotify_album", "spotify_album_cover_url",
+                                     "spotify_track_id", "spotify_duration", "spotify_start", "spotify_end")
+
+    title: str
+    artists: str
+    album: str
+    album_cover_url: str
+    track_id: str
+    duration: timedelta
+    start: datetime
+    end: datetime
+
+    def values(self) -> dict:
+        # The state attributes keep showing the times as text
+        return dict(zip(self.SENSOR_ATTRS, (self.title, self.artists, self.album, self.album_cover_url,
+                                            self.track_id, str(self.duration), str(self.start), str(self.end))))
+
+
+@dataclass(slots=True, frozen=True)
+class ListeningRecord(_Record):
+    SENSOR_ATTRS: ClassVar[tuple] = ("listening", "listening_details", "listening_url")
+
+    name: str
+    details: Optional[str] = None
+    url: Optional[str] = None
+
+
+@dataclass(slots=True, frozen=True)
+class StreamingRecord(_Record):
+    SENSOR_ATTRS: ClassVar[tuple] = ("streaming", "streaming_details", "streaming_url")
+
+    name: str
+    details: Optional[str] = None
+    url: Optional[str] = None
+
+
+@dataclass(slots=True, frozen=True)
+class WatchingRecord(_Record):
+    SENSOR_ATTRS: ClassVar[tuple] = ("watching", "watching_details", "watching_url")
+
+    name: str
+    details: Optional[str] = None
+    url: Optional[str] = None
+
+
+@dataclass(slots=True, frozen=True)
+class CustomRecord(_Record):
+    SENSOR_ATTRS: ClassVar[tuple] = ("custom_status", "custom_emoji")
+
+    status: Optional[str]
+    emoji: Optional[str] = None
+
+
+@dataclass(slots=True, frozen=True)
+class VoiceRecord(_Record):
+    SENSOR_ATTRS: ClassVar[tuple] = ("voice_channel", "voice_deaf", "voice_mute", "voice_self_deaf", "voice_self_mute",
+                                     "voice_self_stream", "voice_self_video", "voice_afk")
+
+    channel: Optional[str]
+    deaf: bool = False
+    mute: bool = False
+    self_deaf: bool = False
+    self_mute: bool = False
+    self_stream: Optional[bool] = False
+    self_video: bool = False
+    afk: bool = False
+
+    @classmethod
+    def from_state(cls, voice: VoiceState) -> "VoiceRecord":
+        return cls(voice.channel.name if voice.channel is not None else None, voice.deaf, voice.mute,
+                   voice.self_deaf, voice.self_mute, voice.self_stream, voice.self_video, voice.afk)
+
+
+# Sub-records of a MemberPresence, with the record type that flattens each one
+PRESENCE_RECORDS = {
+    "game": GameRecord,
+    "spotify": SpotifyRecord,
+    "listening": ListeningRecord,
+    "streaming": StreamingRecord,
+    "watching": WatchingRecord,
+    "custom": CustomRecord,
+    "voice": VoiceRecord,
+}
+
+
+@dataclass(slots=True, frozen=True)
+class MemberPresence:
+    """Status, activities and voice state of a member."""
+
+    status: str = 'unknown'
+    activity_state: Optional[str] = 'unknown'
+    display_name: Optional[str] = None
+    desktop_status: Optional[str] = None
+    mobile_status: Optional[str] = None
+    web_status: Optional[str] = None
+    roles: Optional[tuple] = None
+    game: Optional[GameRecord] = None
+    spotify: Optional[SpotifyRecord] = None
+    listening: Optional[ListeningRecord] = None
+    streaming: Optional[StreamingRecord] = None
+    watching: Optional[WatchingRecord] = None
+    custom: Optional[CustomRecord] = None
+    voice: Optional[VoiceRecord] = None
+
+    def scalar_values(self) -> dict:
+        """Return the sensor values of the fields that are not sub-records, besides the status."""
+        return {
+            "activity_state": self.activity_state,
+            "display_name": self.display_name,
+            "desktop_status": self.desktop_status,
+            "mobile_status": self.mobile_status,
+            "web_status": self.web_status,
+            "roles": list(self.roles) if self.roles is not None else None,
+        }
+
+    def record_values(self, name: str) -> dict:
+        """Return the sensor values of a sub-record."""
+        record = getattr(self, name)
+        return record.values() if record is not None else PRESENCE_RECORDS[name].empty_values()
+
+
+async def member_presence(discord_member: Member, steam_catalog: SteamAppCatalog,
+                          steam_artwork: SteamArtworkCache, asset_urls: AssetUrlResolver) -> MemberPresence:
+    """Build the presence of a member."""
+    activity_state = None
+    game = spotify = listening = streaming = watching = custom = None
+    for activity in discord_member.activities:
+        if activity.type == ActivityType.playing:
+            game = await game_record(activity, steam_catalog, steam_artwork, asset_urls)
+        elif activity.type == ActivityType.streaming:
+            activity: Streaming
+            streaming = StreamingRecord(activity.name, activity.details, activity.url)
+        elif activity.type == ActivityType.listening:
+            if isinstance(activity, Spotify):
+                spotify = SpotifyRecord(activity.title, ", ".join(activity.artists), activity.album,
+                                        asset_urls.media_url(activity.album_cover_url), activity.track_id,
+                                        activity.duration, activity.start, activity.end)
+                listening = ListeningRecord(activity.title)
+            else:
+                activity: Activity
+                activity_state = activity.state
+                listening = ListeningRecord(activity.name, activity.details, activity.url)
+        elif activity.type == ActivityType.watching:
+            activity: Activity
+            activity_state = activity.state
+            watching = WatchingRecord(activity.name, activity.details, activity.url)
+        elif activity.type == ActivityType.custom:
+            activity: CustomActivity
+            activity_state = activity.state
+            custom = CustomRecord(activity.name, activity.emoji.name if activity.emoji else None)
+
+    return MemberPresence(
+        status=discord_member.status,
+        activity_state=activity_state,
+        display_name=discord_member.display_name,
+        desktop_status=str(discord_member.desktop_status),
+        mobile_status=str(discord_member.mobile_status),
+        web_status=str(discord_member.web_status),
+        roles=tuple(role.name for role in discord_member.roles),
+        game=game,
+        spotify=spotify,
+        listening=listening,
+        streaming=streaming,
+        watching=watching,
+        custom=custom,
+        voice=VoiceRecord.from_state(discord_member.voice) if discord_member.voice is not None else None,
+    )
+
+
+async def game_record(activity, steam_catalog: SteamAppCatalog, steam_artwork: SteamArtworkCache,
+                      asset_urls: AssetUrlResolver) -> GameRecord:
+    """Build the game record of a playing activity, with its Steam artwork when the game is on Steam."""
+    images = {}
+    if hasattr(activity, 'large_image_url'):
+        images = {
+            "image_small": asset_urls.media_url(activity.small_image_url),
+            "image_large": asset_urls.media_url(activity.large_image_url),
+            "image_small_text": activity.small_image_text,
+            "image_large_text": activity.large_image_text,
+        }
+    artwork = None
+    steam_app_id = steam_catalog.get_appid(str(activity.name))
+    if steam_app_id:
+        _LOGGER.debug("FOUND Steam app by name = %s, appid = %s", activity.name, steam_app_id)
+        artwork = await steam_artwork.async_get(steam_app_id)
+    return GameRecord(activity.name, getattr(activity, 'state', None), getattr(activity, 'details', None),
+                      artwork=artwork, appid=steam_app_id, **images)
@@ -1,42 +1,60 @@
 import asyncio
-import calendar
+import dataclasses
+import itertools
 import logging
 import re
 import time
-from typing import Union
+from datetime import datetime, timedelta
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Optional
 
-import aiohttp
 import homeassistant.helpers.config_validation as cv
+import nextcord
 import validators
 import voluptuous as vol
-from addict import Dict
 from homeassistant import config_entries, core
-from homeassistant.components.sensor import PLATFORM_SCHEMA, SensorEntity
-from homeassistant.const import CONF_ACCESS_TOKEN
-from homeassistant.const import (EVENT_HOMEASSISTANT_STOP)
+from homeassistant.components.sensor import PLATFORM_SCHEMA, SensorDeviceClass, SensorEntity, SensorStateClass
+from homeassistant.const import CONF_ACCESS_TOKEN, STATE_UNAVAILABLE, STATE_UNKNOWN, UnitOfTime
+from homeassistant.const import EntityCategory
 from homeassistant.helpers import device_registry as dr, entity_registry as er
+from homeassistant.helpers.aiohttp_client import async_create_clientsession
 from homeassistant.helpers.entity import DeviceInfo
-from nextcord import ActivityType, Spotify, Game, Streaming, CustomActivity, Activity, Member, User, VoiceState, RawReactionActionEvent
+from homeassistant.helpers.restore_state import RestoredExtraData, RestoreEntity
+from homeassistant.util import dt as dt_util
+from nextcord import ActivityType, Guild, Member, User, VoiceState, RawReactionActionEvent
 from nextcord.abc import GuildChannel
-from nextcord.ext import tasks
 
-from .const import DOMAIN, CONF_MEMBERS, CONF_CHANNELS, CONF_VOICE_CHANNELS, CONF_IMAGE_FORMAT, CONF_STEAM_API_KEY, CONF_ENTITIES_DISABLED_DEFAULT
+from .assets import AssetUrlResolver
+from .coalesce import UpdateCoalescer
+from .connection import Subscription, async_get_connection
+from .const import DOMAIN, CONF_MEMBERS, CONF_CHANNELS, CONF_VOICE_CHANNELS, CONF_VOICE_OVERVIEW_GUILDS, CONF_IMAGE_FORMAT, \
+    CONF_ROLES, CONF_RECORDER_FRIENDLY, CONF_STEAM_API_KEY, CONF_ENTITIES_DISABLED_DEFAULT, \
+    CONF_COALESCE_WINDOW, CONF_VOICE_IMMEDIATE, DEFAULT_COALESCE_WINDOW, DATA_ASSET_URLS, DATA_DISABLED_DEFAULT_APPLIED, DATA_SESSIONS, DATA_STEAM_ARTWORK, DATA_STEAM_CATALOG
+from .metrics import IntegrationMetrics
+from .presence import PRESENCE_RECORDS, MemberPresence, VoiceRecord, member_presence
+from .sessions import DAY, WEEK, MemberSessions, SessionTracker
+from .steam import SteamAppCatalog, SteamArtworkCache
 
 _LOGGER = logging.getLogger(__name__)
 
 ENTITY_ID_FORMAT = "sensor.discord_user_{}"
 ENTITY_ID_CHANNEL_FORMAT = "sensor.discord_channel_{}"
 ENTITY_ID_VOICE_CHANNEL_FORMAT = "sensor.discord_voice_channel_{}"
+ENTITY_ID_VOICE_OVERVIEW_FORMAT = "sensor.discord_voice_overview_{}"
+ENTITY_ID_ROLE_FORMAT = "sensor.discord_role_{}"
 
-_PATTERN_WITH_SIZE = re.compile(
-    r'^https://cdn\.discordapp\.com/app-assets/\d+/mp:external/([^/]+)/(https/.+?)(_\d+)\.(?:png|jpg|jpeg|webp)$'
-)
-_PATTERN_NO_SIZE = re.compile(
-    r'^https://cdn\.discordapp\.com/app-assets/\d+/mp:external/([^/]+)/(https/.+?)\.(?:png|jpg|jpeg|webp)$'
-)
+# Concurrent REST lookups of the configured users and channels at setup
+SETUP_FETCH_CONCURRENCY = 8
+
+# Watched members updated concurrently when the bot is ready again
+RESYNC_CONCURRENCY = 16
 
-steam_app_list = []
-steam_app_dict = {}
+# Validated URLs remembered by _is_url
+URL_CHECK_CACHE_SIZE = 1024
+
+# Only the diagnostic metrics sensor and the member playtime sensors poll, both are disabled by default
+SCAN_INTERVAL = timedelta(seconds=60)
 
 PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend({
     vol.Required(CONF_ACCESS_TOKEN): cv.string,
@@ -55,6 +73,152 @@ SENSORS = ["user_name", "display_name", "desktop_status", "mobile_status", "web_
            "custom_emoji", "voice_channel", "voice_deaf", "voice_mute", "voice_self_deaf", "voice_self_mute", "voice_self_stream",
            "voice_self_video", "voice_afk"]
 
+# Sub-entity -> (session kind, rolling window in seconds) of the member playtime sensors
+SESSION_SENSORS = {
+    "game_time_24h": ("game", DAY), "game_time_7d": ("game", WEEK),
+    "voice_time_24h": ("voice", DAY), "voice_time_7d": ("voice", WEEK),
+    "online_time_24h": ("online", DAY), "online_time_7d": ("online", WEEK),
+}
+
+MEMBER_SENSORS = SENSORS + list(SESSION_SENSORS)
+
+VOICE_CHANNEL_SENSORS = ["display_names", "usernames"]
+
+# State attribute name -> member state attribute, in the order they are shown
+STATE_ATTRIBUTES = (
+    ('avatar_url', 'avatar_url'), ('activity_state', 'activity_state'), ('user_id', 'userid'),
+    ('user_name', 'user_name'), ('display_name', 'display_name'), ('desktop_status', 'desktop_status'),
+    ('mobile_status', 'mobile_status'), ('web_status', 'web_status'), ('roles', 'roles'), ('game', 'game'),
+    ('game_state', 'game_state'), ('game_details', 'game_details'), ('game_image_small', 'game_image_small'),
+    ('game_image_large', 'game_image_large'), ('game_image_small_text', 'game_image_small_text'),
+    ('game_image_large_text', 'game_image_large_text'), ('game_image_capsule_231x87', 'game_image_capsule_231x87'),
+    ('game_image_capsule_467x181', 'game_image_capsule_467x181'),
+    ('game_image_capsule_616x353', 'game_image_capsule_616x353'), ('game_image_header', 'game_image_header'),
+    ('game_image_hero_capsule', 'game_image_hero_capsule'), ('game_image_library_600x900', 'game_image_library_600x900'),
+    ('game_image_library_hero', 'game_image_library_hero'), ('game_image_logo', 'game_image_logo'),
+    ('game_image_page_bg_raw', 'game_image_page_bg_raw'), ('streaming', 'streaming'), ('streaming_url', 'streaming_url'),
+    ('streaming_details', 'streaming_details'), ('listening', 'listening'), ('listening_url', 'listening_url'),
+    ('listening_details', 'listening_details'), ('spotify_artist', 'spotify_artists'), ('spotify_title', 'spotify_title'),
+    ('spotify_album', 'spotify_album'), ('spotify_album_cover_url', 'spotify_album_cover_url'),
+    ('spotify_track_id', 'spotify_track_id'), ('spotify_duration', 'spotify_duration'), ('spotify_start', 'spotify_start'),
+    ('spotify_end', 'spotify_end'), ('watching', 'watching'), ('watching_url', 'watching_url'),
+    ('watching_details', 'watching_details'), ('custom_status', 'custom_status'), ('custom_emoji', 'custom_emoji'),
+    ('voice_channel', 'voice_channel'), ('voice_server_deafened', 'voice_deaf'), ('voice_server_muted', 'voice_mute'),
+    ('voice_self_deafened', 'voice_self_deaf'), ('voice_self_muted', 'voice_self_mute'),
+    ('voice_streaming', 'voice_self_stream'), ('voice_broadcasting_video', 'voice_self_video'), ('voice_afk', 'voice_afk'),
+)
+
+# Member state attribute -> state attribute name
+ATTRIBUTE_NAMES = {attr: name for name, attr in STATE_ATTRIBUTES}
+
+# State attributes of each presence sub-record
+PRESENCE_RECORD_ATTRIBUTES = {
+    name: tuple(ATTRIBUTE_NAMES[attr] for attr in record.empty_values()) for name, record in PRESENCE_RECORDS.items()
+}
+
+# State attributes still recorded in recorder-friendly mode, the rest change too often to be worth storing
+RECORDED_MEMBER_ATTRIBUTES = frozenset({
+    'avatar_url', 'user_id', 'user_name', 'display_name', 'roles', 'game', 'streaming', 'listening', 'watching',
+    'custom_status', 'voice_channel',
+})
+
+# Member values that are not restored from the last state, they come from the configured user
+UNRESTORED_MEMBER_VALUES = frozenset({'userid', 'user_name'})
+
+
+async def update_discord_entity(_watcher: "DiscordAsyncMemberState", discord_member: Member,
+                                steam_catalog: SteamAppCatalog, steam_artwork: SteamArtworkCache,
+                                asset_urls: AssetUrlResolver):
+    """Replace the presence (status, activities and voice state) of a member state."""
+    _watcher.presence = await member_presence(discord_member, steam_catalog, steam_artwork, asset_urls)
+
+
+async def update_discord_entity_user(_watcher: "DiscordAsyncMemberState", discord_user: User, image_format: str,
+                                     asset_urls: AssetUrlResolver):
+    """Copy the user profile (avatar and names) into a member state."""
+    _watcher.avatar_url = asset_urls.avatar_url(discord_user, image_format)
+    _watcher.userid = discord_user.id
+    _watcher.member = discord_user.name
+    _watcher.user_name = discord_user.global_name
+
+
+@lru_cache(maxsize=URL_CHECK_CACHE_SIZE)
+def _is_url(value: str) -> bool:
+    # Artwork and avatar URLs repeat a lot, and validators.url is slow
+    return bool(validators.url(value))
+
+
+class MemberSnapshot:
+    """Immutable state of a watched member as of its last write.
+
+    The member entity and its sub-entities render from the snapshot, so the state attributes and which
+    values are URLs are worked out once per change instead of on every read. The state attributes are the
+    only flattened copy of the presence records, the sub-entities read their values from them too.
+    """
+
+    __slots__ = ("presence", "member", "state", "attributes", "urls", "restored")
+
+    def __init__(self, presence: MemberPresence, member: str, state: str, attributes: dict,
+                 previous: "MemberSnapshot" = None, restored: bool = False):
+        self.presence = presence
+        self.member = member
+        self.state = state
+        # Restored values don't come from the presence, so none of them can be carried over
+        self.restored = restored
+        self.attributes = MappingProxyType(attributes)
+        # URL flags of unchanged values are carried over, validating URLs is the expensive part
+        urls = []
+        for attr in SENSORS:
+            name = ATTRIBUTE_NAMES[attr]
+            value = attributes[name]
+            if previous is not None and previous.attributes[name] == value:
+                if attr in previous.urls:
+                    urls.append(attr)
+            elif isinstance(value, str) and "://" in value and _is_url(value):
+                urls.append(attr)
+        self.urls = tuple(urls)
+
+    def value(self, attr: str):
+        """Return the value of a member state attribute."""
+        return self.attributes[ATTRIBUTE_NAMES[attr]]
+
+    def changes(self, previous: "MemberSnapshot") -> set:
+        """Return the member state attributes that differ from the previous snapshot."""
+        changed = {attr for name, attr in STATE_ATTRIBUTES if previous.attributes[name] != self.attributes[name]}
+        if previous.state != self.state:
+            changed.add("_state")
+        if previous.member != self.member:
+            changed.add("member")
+        return changed
+
+    @staticmethod
+    def attributes_of(member_state: "DiscordAsyncMemberState", previous: "MemberSnapshot" = None) -> dict:
+        """Flatten the profile and presence of a member state into state attributes.
+
+        Sub-records that are the same as in the previous snapshot keep their previous attributes.
+        """
+        presence = member_state.presence
+        attributes = dict.fromkeys(ATTRIBUTE_NAMES.values())
+        attributes['avatar_url'] = member_state.avatar_url
+        attributes['user_id'] = str(member_state.userid)
+        attributes['user_name'] = member_state.user_name
+        for attr, value in presence.scalar_values().items():
+            attributes[ATTRIBUTE_NAMES[attr]] = value
+        for name in PRESENCE_RECORDS:
+            if previous is not None and not previous.restored and getattr(presence, name) == getattr(previous.presence, name):
+                for attribute in PRESENCE_RECORD_ATTRIBUTES[name]:
+                    attributes[attribute] = previous.attributes[attribute]
+            else:
+                for attr, value in presence.record_values(name).items():
+                    attributes[ATTRIBUTE_NAMES[attr]] = value
+        return attributes
+
+    @classmethod
+    def of(cls, member_state: "DiscordAsyncMemberState", previous: "MemberSnapshot" = None) -> "MemberSnapshot":
+        """Return the snapshot of the current profile and presence of a member state."""
+        presence = member_state.presence
+        return cls(presence, member_state.member, presence.status, cls.attributes_of(member_state, previous), previous)
+
 
 async def async_setup_entry(
         hass: core.HomeAssistant,
@@ -63,32 +227,37 @@ async def async_setup_entry(
 ) -> None:
     """Setup sensors from a config entry created in the integrations UI."""
     config = hass.data[DOMAIN][config_entry.entry_id]
-    import nextcord
     token = config.get(CONF_ACCESS_TOKEN)
     image_format = config.get(CONF_IMAGE_FORMAT)
     steam_api_key = config.get(CONF_STEAM_API_KEY)
     entities_disabled_default = config.get(CONF_ENTITIES_DISABLED_DEFAULT, False)
-
-    bot = nextcord.Client(loop=hass.loop, intents=nextcord.Intents.all())
-    await bot.login(token)
-
-    bot._dc_game_connected = False
-    bot_shutting_down = False
-
-    # noinspection PyUnusedLocal
-    async def async_stop_server(event):
-        nonlocal bot_shutting_down
-        bot_shutting_down = True
-        await bot.close()
+    coalesce_window = config.get(CONF_COALESCE_WINDOW, DEFAULT_COALESCE_WINDOW) / 1000
+    voice_immediate = config.get(CONF_VOICE_IMMEDIATE, True)
+    recorder_friendly = config.get(CONF_RECORDER_FRIENDLY, False)
+
+    # One pooled session, app catalog and artwork cache shared by all config entries
+    if DATA_STEAM_CATALOG not in hass.data:
+        steam_session = async_create_clientsession(hass)
+        hass.data[DATA_STEAM_CATALOG] = SteamAppCatalog(hass, steam_session)
+        hass.data[DATA_STEAM_ARTWORK] = SteamArtworkCache(steam_session)
+    steam_catalog: SteamAppCatalog = hass.data[DATA_STEAM_CATALOG]
+    steam_artwork: SteamArtworkCache = hass.data[DATA_STEAM_ARTWORK]
+    asset_urls: AssetUrlResolver = hass.data.setdefault(DATA_ASSET_URLS, AssetUrlResolver())
+
+    # Sessions stay in memory across reloads of the entry, the store is only read once
+    session_trackers = hass.data.setdefault(DATA_SESSIONS, {})
+    session_tracker: SessionTracker = session_trackers.get(config_entry.entry_id)
+    if session_tracker is None:
+        session_tracker = session_trackers[config_entry.entry_id] = SessionTracker(hass, config_entry.entry_id)
+        await session_tracker.async_load()
+
+    metrics = IntegrationMetrics()
+    hass.data[DOMAIN][f"{config_entry.entry_id}_metrics"] = metrics
 
     def _update_all_entity_states():
         """Push state update to all entities so availability changes are reflected."""
         for _watcher in watchers.values():
-            if _watcher.hass is not None:
-                _watcher.async_schedule_update_ha_state(False)
-            for sensor in _watcher.sensors.values():
-                if sensor.hass is not None:
-                    sensor.async_schedule_update_ha_state(False)
+            _watcher.async_write_changed_states(force=True)
         for _chan in channels.values():
             if _chan.hass is not None:
                 _chan.async_schedule_update_ha_state(False)
@@ -98,461 +267,339 @@ async def async_setup_entry(
             for sensor in _vch.sensors.values():
                 if sensor.hass is not None:
                     sensor.async_schedule_update_ha_state(False)
-
-    async def _reconnect_bot():
-        """Reconnect the bot with exponential backoff."""
-        delay = 10
-        max_delay = 300
-        while not bot_shutting_down:
-            _LOGGER.info("Attempting to reconnect Discord bot in %s seconds...", delay)
-            await asyncio.sleep(delay)
-            if bot_shutting_down:
-                break
-            try:
-                _LOGGER.info("Reconnecting Discord bot...")
-                task = asyncio.create_task(bot.start(token))
-                task.add_done_callback(task_callback)
-                return
-            except Exception as err:
-                _LOGGER.error("Failed to reconnect Discord bot: %s", err)
-                delay = min(delay * 2, max_delay)
-
-    def task_callback(task: asyncio.Task):
-        bot._dc_game_connected = False
-        _update_all_entity_states()
-        if bot_shutting_down:
-            _LOGGER.debug("Discord bot stopped (shutdown requested)")
-            return
-        exc = task.exception() if not task.cancelled() else None
-        if exc:
-            _LOGGER.error("Discord bot task failed with error: %s", exc)
-        else:
-            _LOGGER.warning("Discord bot task ended unexpectedly")
-        asyncio.ensure_future(_reconnect_bot())
-
-    # noinspection PyUnusedLocal
-    async def start_server(event):
-        _LOGGER.debug("Starting server - config flow")
-        hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, async_stop_server)
-        await load_application_list_cache()
-        task = asyncio.create_task(bot.start(token))
-        task.add_done_callback(task_callback)
-
-    hass.bus.async_listen_once("discord_game_setup_finished", start_server)
-
-    @tasks.loop(hours=1)
-    async def refresh_application_lists():
-        await load_application_list_cache()
-
-    refresh_application_lists.start()
-
-    async def load_application_list_cache():
-        await load_steam_application_list()
-
-    async def load_steam_application_list():
-        if not steam_api_key:
-            _LOGGER.warning("Steam API key not configured, skipping Steam app list loading")
-            return
-        timeout = aiohttp.ClientTimeout(total=90, connect=10)
-        try:
-            async with aiohttp.ClientSession(timeout=timeout) as steam_session:
-                _LOGGER.debug("Loading Steam detectable applications - config_flow")
-                global steam_app_list
-                all_apps = []
-                last_appid = 0
-                have_more = True
-                while have_more:
-                    params = {
-                        "key": steam_api_key,
-                        "max_results": 50000,
-                        "include_dlc": "false",
-                        "include_videos": "false",
-                        "include_hardware": "false",
-                    }
-                    if last_appid > 0:
-                        params["last_appid"] = last_appid
-                    async with steam_session.get(
-                        "https://api.steampowered.com/IStoreService/GetAppList/v1/",
-                        params=params
-                    ) as steam_response:
-                        if steam_response.status != 200:
-                            _LOGGER.error("Error loading Steam detectable applications - config_flow, status=%s", steam_response.status)
-                            return
-                        steam_app_list_response = Dict(await steam_response.json())
-                        apps = steam_app_list_response.get('response', {}).get('apps', [])
-                        all_apps.extend(apps)
-                        have_more = steam_app_list_response.get('response', {}).get('have_more_results', False)
-                        if have_more and apps:
-                            last_appid = apps[-1].get('appid', 0)
-                        else:
-                            have_more = False
-                steam_app_list = all_apps
-                global steam_app_dict
-                steam_app_dict = {app['name']: app for app in all_apps if 'name' in app}
-                _LOGGER.debug("Loading Steam detectable applications finished - config_flow, total apps: %s", len(steam_app_list))
-        except asyncio.TimeoutError:
-            _LOGGER.error("Timeout while loading Steam detectable applications - config_flow")
-            return
-
-    # noinspection PyUnusedLocal
-    @bot.event
-    async def on_error(error, *args, **kwargs):
-        _LOGGER.error("Discord bot error in %s: %s", error, args)
-
-    async def update_discord_entity(_watcher: DiscordAsyncMemberState, discord_member: Member):
-        _watcher._state = discord_member.status
-        _watcher.desktop_status = str(discord_member.desktop_status)
-        _watcher.mobile_status = str(discord_member.mobile_status)
-        _watcher.web_status = str(discord_member.web_status)
-        _watcher.roles = [role.name for role in discord_member.roles]
-        _watcher.display_name = discord_member.display_name
-        _watcher.activity_state = None
-        _watcher.game = None
-        _watcher.game_state = None
-        _watcher.game_details = None
-        _watcher.game_image_small = None
-        _watcher.game_image_large = None
-        _watcher.game_image_small_text = None
-        _watcher.game_image_large_text = None
-        _watcher.game_image_capsule_231x87 = None
-        _watcher.game_image_capsule_467x181 = None
-        _watcher.game_image_capsule_616x353 = None
-        _watcher.game_image_header = None
-        _watcher.game_image_hero_capsule = None
-        _watcher.game_image_library_600x900 = None
-        _watcher.game_image_library_hero = None
-        _watcher.game_image_logo = None
-        _watcher.game_image_page_bg_raw = None
-        _watcher.streaming = None
-        _watcher.streaming_details = None
-        _watcher.streaming_url = None
-        _watcher.listening = None
-        _watcher.listening_details = None
-        _watcher.listening_url = None
-        _watcher.spotify_artists = None
-        _watcher.spotify_title = None
-        _watcher.spotify_album = None
-        _watcher.spotify_album_cover_url = None
-        _watcher.spotify_track_id = None
-        _watcher.spotify_duration = None
-        _watcher.spotify_start = None
-        _watcher.spotify_end = None
-        _watcher.watching = None
-        _watcher.watching_details = None
-        _watcher.watching_url = None
-        _watcher.custom_status = None
-        _watcher.custom_emoji = None
-        _watcher.voice_deaf = None
-        _watcher.voice_mute = None
-        _watcher.voice_self_deaf = None
-        _watcher.voice_self_mute = None
-        _watcher.voice_self_stream = None
-        _watcher.voice_self_video = None
-        _watcher.voice_afk = None
-        _watcher.voice_channel = None
-        if discord_member.voice is not None:
-            if discord_member.voice.channel is not None:
-                _watcher.voice_channel = discord_member.voice.channel.name
-            else:
-                _watcher.voice_channel = None
-            _watcher.voice_deaf = discord_member.voice.deaf
-            _watcher.voice_mute = discord_member.voice.mute
-            _watcher.voice_self_deaf = discord_member.voice.self_deaf
-            _watcher.voice_self_mute = discord_member.voice.self_mute
-            _watcher.voice_self_stream = discord_member.voice.self_stream
-            _watcher.voice_self_video = discord_member.voice.self_video
-            _watcher.voice_afk = discord_member.voice.afk
-
-        for activity in discord_member.activities:
-            if activity.type == ActivityType.playing:
-                await load_game_image(_watcher, activity)
-                _watcher.game = activity.name
-                if hasattr(activity, 'state'):
-                    _watcher.game_state = activity.state
-                if hasattr(activity, 'details'):
-                    _watcher.game_details = activity.details
-                continue
-            if activity.type == ActivityType.streaming:
-                activity: Streaming
-                _watcher.streaming = activity.name
-                _watcher.streaming_details = activity.details
-                _watcher.streaming_url = activity.url
-                continue
-            if activity.type == ActivityType.listening:
-                if isinstance(activity, Spotify):
-                    activity: Spotify
-                    _watcher.listening = activity.title
-                    _watcher.spotify_artists = ", ".join(activity.artists)
-                    _watcher.spotify_title = activity.title
-                    _watcher.spotify_album = activity.album
-                    _watcher.spotify_album_cover_url = activity.album_cover_url
-                    _watcher.spotify_track_id = activity.track_id
-                    _watcher.spotify_duration = str(activity.duration)
-                    _watcher.spotify_start = str(activity.start)
-                    _watcher.spotify_end = str(activity.end)
-                    continue
-                else:
-                    activity: Activity
-                    _watcher.activity_state = activity.state
-                    _watcher.listening = activity.name
-                    _watcher.listening_details = activity.details
-                    _watcher.listening_url = activity.url
-                    continue
-            if activity.type == ActivityType.watching:
-                activity: Activity
-                _watcher.activity_state = activity.state
-                _watcher.watching = activity.name
-                _watcher.watching_details = activity.details
-                _watcher.watching_url = activity.url
-                continue
-            if activity.type == ActivityType.custom:
-                activity: CustomActivity
-                _watcher.activity_state = activity.state
-                _watcher.custom_status = activity.name
-                _watcher.custom_emoji = activity.emoji.name if activity.emoji else None
-
-        if _watcher.hass is not None:
-            _watcher.async_schedule_update_ha_state(False)
-
-    async def update_discord_entity_user(_watcher: DiscordAsyncMemberState, discord_user: User):
-        if discord_user.avatar:
-            _watcher.avatar_url = discord_user.display_avatar.with_size(1024).with_static_format(image_format).__str__()
-        else:
-            _watcher.avatar_url = discord_user.default_avatar.url
-        _watcher.userid = discord_user.id
-        _watcher.member = discord_user.name
-        _watcher.user_name = discord_user.global_name
-        if _watcher.hass is not None:
-            _watcher.async_schedule_update_ha_state(False)
-
-    def to_media_discord_url(url: str) -> str:
-        if not url or "mp:external" not in url:
-            return url
-
-        m = _PATTERN_WITH_SIZE.match(url)
-        if m:
-            return f"https://media.discordapp.net/external/{m.group(1)}/{m.group(2)}{m.group(3)}"
-
-        m = _PATTERN_NO_SIZE.match(url)
-        if m:
-            return f"https://media.discordapp.net/external/{m.group(1)}/{m.group(2)}"
-
-        return url
-
-    async def load_game_image(_watcher: DiscordAsyncMemberState, activity: Union[Activity, Game, Streaming]):
-        if hasattr(activity, 'large_image_url'):
-            _watcher.game_image_small = to_media_discord_url(activity.small_image_url)
-            _watcher.game_image_large = to_media_discord_url(activity.large_image_url)
-            _watcher.game_image_small_text = activity.small_image_text
-            _watcher.game_image_large_text = activity.large_image_text
-        steam_app = steam_app_dict.get(str(activity.name))
-        if steam_app:
-            steam_app_id = steam_app["appid"]
-            _LOGGER.debug("FOUND Steam app by name = %s", steam_app)
-            timestamp = calendar.timegm(time.gmtime())
-            image_urls = {
-                "game_image_capsule_231x87": f"https://cdn.cloudflare.steamstatic.com/steam/apps/{steam_app_id}/capsule_231x87.jpg?t={timestamp}",
-                "game_image_capsule_467x181": f"https://cdn.cloudflare.steamstatic.com/steam/apps/{steam_app_id}/capsule_467x181.jpg?t={timestamp}",
-                "game_image_capsule_616x353": f"https://cdn.cloudflare.steamstatic.com/steam/apps/{steam_app_id}/capsule_616x353.jpg?t={timestamp}",
-                "game_image_header": f"https://cdn.cloudflare.steamstatic.com/steam/apps/{steam_app_id}/header.jpg?t={timestamp}",
-                "game_image_hero_capsule": f"https://cdn.cloudflare.steamstatic.com/steam/apps/{steam_app_id}/hero_capsule.jpg?t={timestamp}",
-                "game_image_library_600x900": f"https://cdn.cloudflare.steamstatic.com/steam/apps/{steam_app_id}/library_600x900.jpg?t={timestamp}",
-                "game_image_library_hero": f"https://cdn.cloudflare.steamstatic.com/steam/apps/{steam_app_id}/library_hero.jpg?t={timestamp}",
-                "game_image_logo": f"https://cdn.cloudflare.steamstatic.com/steam/apps/{steam_app_id}/logo.jpg?t={timestamp}",
-                "game_image_page_bg_raw": f"https://cdn.cloudflare.steamstatic.com/steam/apps/{steam_app_id}/page_bg_raw.jpg?t={timestamp}",
-            }
-            game_image_logo_png = f"https://cdn.cloudflare.steamstatic.com/steam/apps/{steam_app_id}/logo.png?t={timestamp}"
-
-            async with aiohttp.ClientSession() as session:
-                async def check_resource_exists(url):
-                    _LOGGER.debug("Checking if web resource [%s] exists", url)
-                    async with session.head(url) as response:
-                        _LOGGER.debug("Resource [%s] response status = %s", url, response.status)
-                        return response.status == 200
-
-                results = await asyncio.gather(
-                    *[check_resource_exists(url) for url in image_urls.values()],
-                    check_resource_exists(game_image_logo_png)
-                )
-
-                for (attr, url), exists in zip(image_urls.items(), results):
-                    if exists:
-                        setattr(_watcher, attr, url)
-
-                # logo.png overrides logo.jpg if it exists
-                if results[-1]:
-                    _watcher.game_image_logo = game_image_logo_png
-
-    @bot.event
+        for _overview in voice_overviews.values():
+            if _overview.hass is not None:
+                _overview.async_schedule_update_ha_state(False)
+        for _aggregate in role_aggregates.values():
+            if _aggregate.hass is not None:
+                _aggregate.async_schedule_update_ha_state(False)
+        if playing_index.hass is not None:
+            playing_index.async_schedule_update_ha_state(False)
+
+    # Entities start unavailable and are written unavailable by on_disconnect. Until the next on_ready or
+    # on_resumed every entity is written again, otherwise only the ones that changed meanwhile.
+    entities_unavailable = True
+    resync_limit = asyncio.Semaphore(RESYNC_CONCURRENCY)
+
+    async def _resync_watcher(client: nextcord.Client, _watcher: "DiscordAsyncMemberState", force: bool):
+        async with resync_limit:
+            _member = next(filter(None, (guild.get_member(_watcher.userid) for guild in client.guilds)), None)
+            # Users are only kept by nextcord while they have a cached member, the member carries the same profile
+            _user = client.get_user(_watcher.userid) or _member
+            if _user is not None:
+                await update_discord_entity_user(_watcher, _user, image_format, asset_urls)
+            if _member is not None:
+                await update_discord_entity(_watcher, _member, steam_catalog, steam_artwork, asset_urls)
+        _watcher.async_write_changed_states(force=force)
+
+    @metrics.timed
     async def on_ready():
-        bot._dc_game_connected = True
-        _LOGGER.info("Discord bot connected (on_ready)")
-        users = {str(_user.id): _user for _user in bot.users}
-        members = {str(_member.id): _member for _member in list(bot.get_all_members())}
-        for _watcher_id, _watcher in watchers.items():
-            if users.get(_watcher_id) is not None:
-                await update_discord_entity_user(_watcher, users.get(_watcher_id))
-            if members.get(_watcher_id) is not None:
-                await update_discord_entity(_watcher, members.get(_watcher_id))
-                for sensor in _watcher.sensors.values():
-                    if sensor.hass is not None:
-                        sensor.async_schedule_update_ha_state(False)
+        nonlocal entities_unavailable
+        force, entities_unavailable = entities_unavailable, False
+        client = connection.client
+        # Watched members are looked up directly and updated concurrently, Steam lookups of one don't hold up the rest
+        await asyncio.gather(*[_resync_watcher(client, _watcher, force) for _watcher in watchers.values()])
         for name, _chan in channels.items():
-            if _chan.hass is not None:
+            if force and _chan.hass is not None:
                 _chan.async_schedule_update_ha_state(False)
         for _vch_id, _vch in voice_channels.items():
+            changed = False
             try:
-                vc = bot.get_channel(int(_vch_id))
+                vc = client.get_channel(int(_vch_id))
                 if vc is not None:
-                    _vch._user_count = len(vc.members)
-                    _vch._members = [m.display_name for m in vc.members]
-                    _vch._member_usernames = [m.name for m in vc.members]
+                    changed = _vch.reset_roster(vc.members)
             except Exception:
                 _LOGGER.debug("Could not initialize voice channel %s", _vch_id)
-            if _vch.hass is not None:
-                _vch.async_schedule_update_ha_state(False)
-                for sensor in _vch.sensors.values():
-                    if sensor.hass is not None:
-                        sensor.async_schedule_update_ha_state(False)
-
-    @bot.event
+            if force or changed:
+                _vch.async_write_roster()
+        for _guild_id, _overview in voice_overviews.items():
+            # Seeded from the voice states in the gateway cache, voice events keep it up to date
+            guild = client.get_guild(int(_guild_id))
+            changed = guild is not None and _overview.reset(guild)
+            if (force or changed) and _overview.hass is not None:
+                _overview.async_schedule_update_ha_state(False)
+        for _role_id, _aggregate in role_aggregates.items():
+            # The connection cached the role members, presence, voice and role updates keep the counts up to date
+            role = next((guild.get_role(int(_role_id)) for guild in client.guilds
+                         if guild.get_role(int(_role_id)) is not None), None)
+            changed = role is not None and _aggregate.reset(role.members)
+            if (force or changed) and _aggregate.hass is not None:
+                _aggregate.async_schedule_update_ha_state(False)
+        if force and playing_index.hass is not None:
+            playing_index.async_schedule_update_ha_state(False)
+
+    @metrics.timed
     async def on_disconnect():
-        if bot._dc_game_connected:
-            bot._dc_game_connected = False
-            _LOGGER.warning("Discord bot disconnected")
-            _update_all_entity_states()
+        nonlocal entities_unavailable
+        entities_unavailable = True
+        # Nothing is known about the members until the bot is back, that time isn't counted as playtime
+        now = time.time()
+        for _watcher in watchers.values():
+            _watcher.sessions.close(now)
+        session_tracker.async_schedule_save()
+        _update_all_entity_states()
 
-    @bot.event
+    @metrics.timed
     async def on_resumed():
-        if not bot._dc_game_connected:
-            bot._dc_game_connected = True
-            _LOGGER.info("Discord bot resumed connection")
+        nonlocal entities_unavailable
+        # Missed events are replayed on resume, only availability has to be written
+        if entities_unavailable:
+            entities_unavailable = False
             _update_all_entity_states()
 
-    # noinspection PyUnusedLocal
-    @bot.event
-    async def on_member_update(before: Member, after: Member):
-        _watcher = watchers.get(str(after.id))
+    @metrics.timed
+    async def flush_member_update(_watcher_id: str, _member: Member):
+        _watcher = watchers.get(_watcher_id)
         if _watcher is not None:
-            await update_discord_entity(_watcher, after)
-            for sensor in _watcher.sensors.values():
-                sensor.async_schedule_update_ha_state(False)
+            await update_discord_entity(_watcher, _member, steam_catalog, steam_artwork, asset_urls)
+            _watcher.async_write_changed_states()
 
-    # noinspection PyUnusedLocal
-    @bot.event
-    async def on_presence_update(before: Member, after: Member):
-        _watcher = watchers.get(str(after.id))
-        if _watcher is not None:
-            await update_discord_entity(_watcher, after)
-            for sensor in _watcher.sensors.values():
-                sensor.async_schedule_update_ha_state(False)
+    # Bursts of member, presence and voice events for one member are merged into a single update
+    member_updates = UpdateCoalescer(hass, coalesce_window, flush_member_update)
+    config_entry.async_on_unload(member_updates.cancel)
 
-    # noinspection PyUnusedLocal
-    @bot.event
-    async def on_user_update(before: User, after: User):
-        _watcher: DiscordAsyncMemberState = watchers.get(str(after.id))
+    @metrics.timed
+    async def on_member_update(_member: Member):
+        await member_updates.async_push(str(_member.id), _member)
+
+    @metrics.timed
+    async def on_presence_update(_member: Member):
+        await member_updates.async_push(str(_member.id), _member)
+
+    @metrics.timed
+    async def on_user_update(_user: User):
+        _watcher: DiscordAsyncMemberState = watchers.get(str(_user.id))
         if _watcher is not None:
-            await update_discord_entity_user(_watcher, after)
-            for sensor in _watcher.sensors.values():
-                sensor.async_schedule_update_ha_state(False)
+            await update_discord_entity_user(_watcher, _user, image_format, asset_urls)
+            _watcher.async_write_changed_states()
 
-    # noinspection PyUnusedLocal
-    @bot.event
+    @metrics.timed
     async def on_voice_state_update(_member: Member, before: VoiceState, after: VoiceState):
         _watcher = watchers.get(str(_member.id))
-        if _watcher is not None:
-            if after.channel is not None:
-                _watcher.voice_channel = after.channel.name
-            else:
-                _watcher.voice_channel = None
-            _watcher.voice_deaf = after.deaf
-            _watcher.voice_mute = after.mute
-            _watcher.voice_self_deaf = after.self_deaf
-            _watcher.voice_self_mute = after.self_mute
-            _watcher.voice_self_stream = after.self_stream
-            _watcher.voice_self_video = after.self_video
-            _watcher.voice_afk = after.afk
-            _watcher.async_schedule_update_ha_state(False)
-            for sensor in _watcher.sensors.values():
-                sensor.async_schedule_update_ha_state(False)
-
-        # Update voice channel entities when users join/leave/switch
-        if before.channel is not None:
+        if _watcher is not None and not voice_immediate:
+            # update_discord_entity reads the voice state from the member
+            await member_updates.async_push(str(_member.id), _member)
+        elif _watcher is not None:
+            # A presence update still waiting in the window goes out now instead of after the voice change. It
+            # reads the voice state from the member as well, so the write below only happens if that differs.
+            await member_updates.async_flush(str(_member.id))
+            # Same record update_discord_entity builds from member.voice, None once the member left voice
+            voice = VoiceRecord.from_state(after) if after.channel is not None else None
+            _watcher.presence = dataclasses.replace(_watcher.presence, voice=voice)
+            _watcher.async_write_changed_states()
+
+        # Apply the join, leave or switch to the rosters of the voice channels involved
+        if before.channel is not None and (after.channel is None or after.channel.id != before.channel.id):
             _vch = voice_channels.get(str(before.channel.id))
-            if _vch is not None:
-                _vch._user_count = len(before.channel.members)
-                _vch._members = [m.display_name for m in before.channel.members]
-                _vch._member_usernames = [m.name for m in before.channel.members]
-                _vch.async_schedule_update_ha_state(False)
-                for sensor in _vch.sensors.values():
-                    if sensor.hass is not None:
-                        sensor.async_schedule_update_ha_state(False)
+            if _vch is not None and _vch.remove_member(_member.id):
+                _vch.async_write_roster()
         if after.channel is not None:
             _vch = voice_channels.get(str(after.channel.id))
-            if _vch is not None:
-                _vch._user_count = len(after.channel.members)
-                _vch._members = [m.display_name for m in after.channel.members]
-                _vch._member_usernames = [m.name for m in after.channel.members]
-                _vch.async_schedule_update_ha_state(False)
-                for sensor in _vch.sensors.values():
-                    if sensor.hass is not None:
-                        sensor.async_schedule_update_ha_state(False)
+            # Also refreshes the names of a member that stayed in the channel
+            if _vch is not None and _vch.add_member(_member):
+                _vch.async_write_roster()
+
+    @metrics.timed
+    async def on_guild_voice_state_update(_member: Member, before: VoiceState, after: VoiceState):
+        _overview = voice_overviews.get(str(_member.guild.id))
+        if _overview is not None and _overview.apply_voice_update(before.channel, after.channel):
+            if _overview.hass is not None:
+                _overview.async_schedule_update_ha_state(False)
+
+    def _write_role_aggregates(_member: Member, in_voice: bool = None, role_ids=None) -> None:
+        """Apply the current state of a member to the aggregates of its roles, or of role_ids."""
+        entry = role_member_entry(_member, in_voice)
+        for role_id in (role_ids if role_ids is not None else (role.id for role in _member.roles)):
+            _aggregate = role_aggregates.get(str(role_id))
+            if _aggregate is not None and _aggregate.apply(_member.id, entry) and _aggregate.hass is not None:
+                _aggregate.async_schedule_update_ha_state(False)
+
+    @metrics.timed
+    async def on_role_member_update(before: Member, after: Member):
+        after_role_ids = {role.id for role in after.roles}
+        for role in before.roles:
+            _aggregate = role_aggregates.get(str(role.id))
+            if role.id not in after_role_ids and _aggregate is not None and _aggregate.discard(after.id):
+                if _aggregate.hass is not None:
+                    _aggregate.async_schedule_update_ha_state(False)
+        _write_role_aggregates(after, role_ids=after_role_ids)
+
+    @metrics.timed
+    async def on_role_presence_update(_member: Member):
+        _write_role_aggregates(_member)
 
-    @bot.event
+    # noinspection PyUnusedLocal
+    @metrics.timed
+    async def on_role_voice_state_update(_member: Member, before: VoiceState, after: VoiceState):
+        _write_role_aggregates(_member, after.channel is not None)
+
+    @metrics.timed
+    async def on_role_member_remove(_member: Member):
+        for role in _member.roles:
+            _aggregate = role_aggregates.get(str(role.id))
+            if _aggregate is not None and _aggregate.discard(_member.id) and _aggregate.hass is not None:
+                _aggregate.async_schedule_update_ha_state(False)
+
+    @metrics.timed
     async def on_raw_reaction_add(payload: RawReactionActionEvent):
-        channel_id = payload.channel_id
-        _channel: GuildChannel = await bot.fetch_channel(channel_id)
+        # The connection only routes reactions of this entry's channels, everything here comes from the gateway
+        _chan = channels.get(str(payload.channel_id))
         _member: Member = payload.member
-        _chan = channels.get("{}".format(_channel))
-        if _chan:
+        if _chan and _member is not None:
+            _channel: GuildChannel = connection.client.get_channel(payload.channel_id)
+            if _channel is not None:
+                _chan._channel_name = _channel.name
             _chan._state = _member.display_name
             _chan._last_user = _member.display_name
             _chan.async_schedule_update_ha_state(False)
 
+    # Up to 20 digits because 2^64 (snowflake-length) is 20 digits long
+    member_ids = [member for member in config.get(CONF_MEMBERS) if re.match(r"^\d{1,20}$", str(member))]
+    channel_ids = [channel for channel in config.get(CONF_CHANNELS) if re.match(r"^\d{1,20}$", str(channel))]
+    voice_channel_ids = [channel for channel in config.get(CONF_VOICE_CHANNELS, []) if re.match(r"^\d{1,20}$", str(channel))]
+    voice_overview_guild_ids = [guild for guild in config.get(CONF_VOICE_OVERVIEW_GUILDS, []) if re.match(r"^\d{1,20}$", str(guild))]
+    role_ids = [role for role in config.get(CONF_ROLES, []) if re.match(r"^\d{1,20}$", str(role))]
+
+    # Entries using the same bot share one gateway connection, which routes the events of their members and channels
+    connection = async_get_connection(hass, token)
+    subscription = Subscription(
+        metrics, member_ids, channel_ids, voice_channel_ids, steam_api_key, voice_overview_guild_ids, role_ids,
+        on_ready=on_ready, on_disconnect=on_disconnect, on_resumed=on_resumed, on_member_update=on_member_update,
+        on_presence_update=on_presence_update, on_user_update=on_user_update,
+        on_voice_state_update=on_voice_state_update, on_guild_voice_state_update=on_guild_voice_state_update,
+        on_role_member_update=on_role_member_update, on_role_presence_update=on_role_presence_update,
+        on_role_voice_state_update=on_role_voice_state_update, on_role_member_remove=on_role_member_remove,
+        on_raw_reaction_add=on_raw_reaction_add,
+    )
+    client = await connection.async_attach(config_entry.entry_id, subscription)
+
+    @core.callback
+    def _detach():
+        hass.async_create_task(connection.async_detach(config_entry.entry_id, subscription))
+
+    config_entry.async_on_unload(_detach)
+
+    # Resolve the configured users and channels concurrently. The limit keeps the burst of REST calls small,
+    # nextcord itself waits out the rate limits.
+    fetch_limit = asyncio.Semaphore(SETUP_FETCH_CONCURRENCY)
+
+    async def _fetch(fetch, object_id, kind):
+        """Fetch one configured user or channel, None if it can't be resolved."""
+        async with fetch_limit:
+            try:
+                return await fetch(object_id)
+            except nextcord.HTTPException as err:
+                _LOGGER.warning("Could not fetch Discord %s %s, skipping it: %s", kind, object_id, err)
+                return None
+
+    fetched = await asyncio.gather(
+        *[_fetch(client.fetch_user, member, "user") for member in member_ids],
+        *[_fetch(client.fetch_channel, channel, "channel") for channel in channel_ids + voice_channel_ids],
+        *[_fetch(client.fetch_guild, guild, "server") for guild in voice_overview_guild_ids],
+    )
+    users = fetched[:len(member_ids)]
+    text_chans = fetched[len(member_ids):len(member_ids) + len(channel_ids)]
+    voice_chans = fetched[len(member_ids) + len(channel_ids):len(member_ids) + len(channel_ids) + len(voice_channel_ids)]
+    guilds = fetched[len(member_ids) + len(channel_ids) + len(voice_channel_ids):]
+
+    # Roles are only listed per guild, so the guilds of the bot are fetched with their roles to find them
+    role_guilds = []
+    if role_ids:
+        try:
+            bot_guilds = [guild async for guild in client.fetch_guilds(limit=None)]
+        except nextcord.HTTPException as err:
+            _LOGGER.warning("Could not fetch the Discord servers of the bot, skipping the roles: %s", err)
+            bot_guilds = []
+        role_guilds = await asyncio.gather(*[_fetch(client.fetch_guild, guild.id, "server") for guild in bot_guilds])
+
+    member_state_class = RecorderFriendlyMemberState if recorder_friendly else DiscordAsyncMemberState
+    playing_index = DiscordPlayingIndex(hass, connection, config_entry.entry_id)
     watchers = {}
-    for member in config.get(CONF_MEMBERS):
-        if re.match(r"^\d{,20}", str(member)):  # Up to 20 digits because 2^64 (snowflake-length) is 20 digits long
-            user = await bot.fetch_user(member)
-            if user:
-                watcher: DiscordAsyncMemberState = \
-                    DiscordAsyncMemberState(hass, bot, user.name, user.global_name, user.id, entities_disabled_default)
-                watchers[str(user.id)] = watcher
+    for user in users:
+        if user:
+            watcher: DiscordAsyncMemberState = \
+                member_state_class(hass, connection, user.name, user.global_name, user.id, entities_disabled_default, ())
+            watcher.sessions = session_tracker.member(str(user.id))
+            watcher.playing = playing_index
+            watchers[str(user.id)] = watcher
+    session_tracker.retain(watchers)
 
     channels = {}
-    for channel in config.get(CONF_CHANNELS):
-        if re.match(r"^\d{,20}", str(channel)):  # Up to 20 digits because 2^64 (snowflake-length) is 20 digits long
-            chan: GuildChannel = await bot.fetch_channel(channel)
-            if chan:
-                ch: DiscordAsyncReactionState = DiscordAsyncReactionState(hass, bot, chan.name, chan.id)
-                channels[ch.name] = ch
+    for chan in text_chans:
+        chan: GuildChannel
+        if chan:
+            ch: DiscordAsyncReactionState = DiscordAsyncReactionState(hass, connection, chan.name, chan.id)
+            channels[str(chan.id)] = ch
 
     voice_channels = {}
-    for channel in config.get(CONF_VOICE_CHANNELS, []):
-        if re.match(r"^\d{,20}", str(channel)):  # Up to 20 digits because 2^64 (snowflake-length) is 20 digits long
-            chan = await bot.fetch_channel(channel)
-            if chan:
-                vch: DiscordAsyncVoiceChannelState = DiscordAsyncVoiceChannelState(hass, bot, chan.name, chan.id, entities_disabled_default)
-                voice_channels[str(chan.id)] = vch
+    for chan in voice_chans:
+        if chan:
+            vch: DiscordAsyncVoiceChannelState = DiscordAsyncVoiceChannelState(hass, connection, chan.name, chan.id, entities_disabled_default, ())
+            voice_channels[str(chan.id)] = vch
+
+    voice_overviews = {}
+    for guild in guilds:
+        if guild:
+            voice_overviews[str(guild.id)] = DiscordGuildVoiceOverview(hass, connection, guild.name, guild.id)
+
+    role_aggregates = {}
+    for role_id in role_ids:
+        for guild in role_guilds:
+            role = guild.get_role(int(role_id)) if guild else None
+            if role is not None:
+                role_aggregates[str(role.id)] = DiscordRoleAggregate(hass, connection, guild.name, role.name, role.id)
+                break
+        else:
+            _LOGGER.warning("Discord role %s not found, skipping it", role_id)
+
+    metrics_sensor = DiscordGameMetricsSensor(hass, connection, config_entry.entry_id, metrics)
+
+    def _all_entities():
+        yield from watchers.values()
+        for w in watchers.values():
+            yield from w.sensors.values()
+        yield from channels.values()
+        yield from voice_channels.values()
+        for vch in voice_channels.values():
+            yield from vch.sensors.values()
+        yield from voice_overviews.values()
+        yield from role_aggregates.values()
+        yield playing_index
+        yield metrics_sensor
+
+    def _sub_entities():
+        """Yield (owner, attr) of every sub-entity, created or not."""
+        for w in watchers.values():
+            for attr in MEMBER_SENSORS:
+                yield w, attr
+        for vch in voice_channels.values():
+            for attr in VOICE_CHANNEL_SENSORS:
+                yield vch, attr
+
+    def _sub_entity_owner(unique_id: str):
+        """Return (owner, attr) of a sub-entity unique ID, None if it is not one of ours."""
+        for prefix, owners, attrs in ((ENTITY_ID_FORMAT.format(""), watchers, MEMBER_SENSORS),
+                                      (ENTITY_ID_VOICE_CHANNEL_FORMAT.format(""), voice_channels, VOICE_CHANNEL_SENSORS)):
+            if unique_id.startswith(prefix):
+                owner_id, _, attr = unique_id[len(prefix):].partition("_")
+                owner = owners.get(owner_id)
+                if owner is not None and attr in attrs:
+                    return owner, attr
+        return None
 
     # Remove entities for users/channels no longer in config
     ent_reg = er.async_get(hass)
-    current_unique_ids = set()
-    for w in watchers.values():
-        current_unique_ids.add(w.unique_id)
-        for s in w.sensors.values():
-            current_unique_ids.add(s.unique_id)
-    for ch in channels.values():
-        current_unique_ids.add(ch.unique_id)
-    for vch in voice_channels.values():
-        current_unique_ids.add(vch.unique_id)
-        for s in vch.sensors.values():
-            current_unique_ids.add(s.unique_id)
+    current_unique_ids = {entity.unique_id for entity in _all_entities()}
+    current_unique_ids.update(owner.sub_entity_unique_id(attr) for owner, attr in _sub_entities())
 
     dev_reg = dr.async_get(hass)
+    registered = {}
     for entity in er.async_entries_for_config_entry(ent_reg, config_entry.entry_id):
         if entity.unique_id not in current_unique_ids:
             _LOGGER.debug("Removing stale entity %s (unique_id=%s)", entity.entity_id, entity.unique_id)
             ent_reg.async_remove(entity.entity_id)
+        else:
+            registered[entity.unique_id] = entity
 
     # Remove devices that no longer have any entities
     for device in dr.async_entries_for_config_entry(dev_reg, config_entry.entry_id):
@@ -560,24 +607,68 @@ async def async_setup_entry(
             _LOGGER.debug("Removing orphaned device %s (id=%s)", device.name, device.id)
             dev_reg.async_remove_device(device.id)
 
-    # Sync existing sub-entity enabled/disabled state with the toggle.
-    # _attr_entity_registry_enabled_default only applies on first registration,
-    # so we must explicitly update registry entries for already-registered entities.
-    sub_entity_unique_ids = set()
-    for w in watchers.values():
-        for s in w.sensors.values():
-            sub_entity_unique_ids.add(s.unique_id)
-    for vch in voice_channels.values():
-        for s in vch.sensors.values():
-            sub_entity_unique_ids.add(s.unique_id)
-    for entity in er.async_entries_for_config_entry(ent_reg, config_entry.entry_id):
-        if entity.unique_id in sub_entity_unique_ids:
-            if entities_disabled_default and entity.disabled_by is None:
-                ent_reg.async_update_entity(entity.entity_id, disabled_by=er.RegistryEntryDisabler.INTEGRATION)
-            elif not entities_disabled_default and entity.disabled_by == er.RegistryEntryDisabler.INTEGRATION:
-                ent_reg.async_update_entity(entity.entity_id, disabled_by=None)
-
-    if len(watchers) > 0:
+    # Only enabled sub-entities get an entity object, disabled ones exist in the registry alone.
+    # Existing registry entries are only synced when the toggle itself changed, _attr_entity_registry_enabled_default
+    # only applies on first registration. Enabling an entity reloads the entry, and a sub-entity the user
+    # enabled must not be disabled again by that reload.
+    applied_toggles = hass.data.setdefault(DATA_DISABLED_DEFAULT_APPLIED, {})
+    toggle_changed = applied_toggles.get(config_entry.entry_id, entities_disabled_default) != entities_disabled_default
+    applied_toggles[config_entry.entry_id] = entities_disabled_default
+    for owner, attr in _sub_entities():
+        entity = registered.get(owner.sub_entity_unique_id(attr))
+        # The polled playtime sensors are disabled by default whatever the toggle says
+        disabled_default = entities_disabled_default or attr in SESSION_SENSORS
+        if entity is None:
+            if disabled_default:
+                # Registered disabled straight away, the entity is created if the user enables it
+                sensor = owner.create_sensor(attr)
+                device = dev_reg.async_get_or_create(config_entry_id=config_entry.entry_id, **sensor.device_info)
+                ent_reg.async_get_or_create(
+                    "sensor", DOMAIN, sensor.unique_id, suggested_object_id=sensor.entity_id.split(".", 1)[1],
+                    config_entry=config_entry, device_id=device.id, original_name=sensor.name,
+                    disabled_by=er.RegistryEntryDisabler.INTEGRATION,
+                )
+                continue
+        elif toggle_changed and disabled_default and entity.disabled_by is None:
+            ent_reg.async_update_entity(entity.entity_id, disabled_by=er.RegistryEntryDisabler.INTEGRATION)
+            continue
+        elif toggle_changed and not disabled_default and entity.disabled_by == er.RegistryEntryDisabler.INTEGRATION:
+            ent_reg.async_update_entity(entity.entity_id, disabled_by=None)
+        elif entity.disabled_by is not None:
+            continue
+        owner.sensors[attr] = owner.create_sensor(attr)
+
+    for entity in _all_entities():
+        entity.metrics = metrics
+
+    @core.callback
+    def _async_sub_entity_toggled(event: core.Event) -> None:
+        """Create a sub-entity when it gets enabled, forget it when it gets disabled."""
+        if event.data["action"] != "update" or "disabled_by" not in event.data["changes"]:
+            return
+        entity = ent_reg.async_get(event.data["entity_id"])
+        if entity is None or entity.config_entry_id != config_entry.entry_id:
+            return
+        owner_attr = _sub_entity_owner(entity.unique_id)
+        if owner_attr is None:
+            return
+        owner, attr = owner_attr
+        if entity.disabled_by is None and attr not in owner.sensors:
+            sensor = owner.sensors[attr] = owner.create_sensor(attr)
+            sensor.metrics = metrics
+            async_add_entities([sensor])
+        elif entity.disabled_by is not None:
+            # The entity removes itself from hass when disabled
+            owner.sensors.pop(attr, None)
+
+    config_entry.async_on_unload(hass.bus.async_listen(er.EVENT_ENTITY_REGISTRY_UPDATED, _async_sub_entity_toggled))
+
+    # A connection that is not up yet is in its grace period, the entities are first written available with
+    # their restored state and the bot being ready only writes what changed
+    entities_unavailable = not connection.available
+
+    # An entry with only channels, voice overviews or roles connects as well
+    if watchers or channels or voice_channels or voice_overviews or role_aggregates:
         async_add_entities(watchers.values())
         for sensors in watchers.values():
             async_add_entities(sensors.sensors.values())
@@ -585,72 +676,97 @@ async def async_setup_entry(
         async_add_entities(voice_channels.values())
         for vch in voice_channels.values():
             async_add_entities(vch.sensors.values())
-        hass.bus.async_fire("discord_game_setup_finished")
+        async_add_entities(voice_overviews.values())
+        async_add_entities(role_aggregates.values())
+        async_add_entities([playing_index, metrics_sensor])
+        hass.async_create_task(connection.async_start(config_entry.entry_id))
+
+
+class MeteredSensorEntity(SensorEntity):
+    """SensorEntity that counts its state writes in the metrics of its config entry."""
+
+    metrics: IntegrationMetrics = None
+
+    @core.callback
+    def async_write_ha_state(self) -> None:
+        if self.metrics is not None:
+            self.metrics.state_writes += 1
+        super().async_write_ha_state()
 
 
-class DiscordAsyncMemberState(SensorEntity):
-    def __init__(self, hass, client, member, user_name, userid, entities_disabled_default=False):
+class DiscordAsyncMemberState(MeteredSensorEntity, RestoreEntity):
+    def __init__(self, hass, client, member, user_name, userid, entities_disabled_default=False, sensors=MEMBER_SENSORS):
         self.member = member
         self.userid = userid
         self.hass = hass
         self.client = client
-        self._state = 'unknown'
-        self.activity_state = 'unknown'
         self.user_name = user_name
-        self.display_name = None
-        self.desktop_status = None
-        self.mobile_status = None
-        self.web_status = None
-        self.roles = None
-        self.game = None
-        self.game_state = None
-        self.game_details = None
-        self.game_image_small = None
-        self.game_image_large = None
-        self.game_image_small_text = None
-        self.game_image_large_text = None
-        self.game_image_capsule_231x87 = None
-        self.game_image_capsule_467x181 = None
-        self.game_image_capsule_616x353 = None
-        self.game_image_header = None
-        self.game_image_hero_capsule = None
-        self.game_image_library_600x900 = None
-        self.game_image_library_hero = None
-        self.game_image_logo = None
-        self.game_image_page_bg_raw = None
-        self.streaming = None
-        self.streaming_url = None
-        self.streaming_details = None
-        self.listening = None
-        self.listening_url = None
-        self.listening_details = None
-        self.spotify_artists = None
-        self.spotify_title = None
-        self.spotify_album = None
-        self.spotify_album_cover_url = None
-        self.spotify_track_id = None
-        self.spotify_duration = None
-        self.spotify_start = None
-        self.spotify_end = None
-        self.watching = None
-        self.watching_url = None
-        self.watching_details = None
         self.avatar_url = None
-        self.custom_status = None
-        self.custom_emoji = None
-        self.voice_channel = None
-        self.voice_deaf = None
-        self.voice_mute = None
-        self.voice_self_deaf = None
-        self.voice_self_mute = None
-        self.voice_self_stream = None
-        self.voice_self_video = None
-        self.voice_afk = None
+        self.presence = MemberPresence()
+        self.sessions = MemberSessions()
+        self.playing: Optional[DiscordPlayingIndex] = None
         self.entity_id = ENTITY_ID_FORMAT.format(self.userid)
-        sensors_dict = {}
-        for sensor_name in SENSORS:
-            sensors_dict[sensor_name] = GenericSensor(sensor=self, attr=sensor_name, disabled_default=entities_disabled_default)
-        self.sensors = sensors_dict
+        self.entities_disabled_default = entities_disabled_default
+        # Sub-entities that were created, async_setup_entry only creates the enabled ones
+        self.sensors = {sensor_name: self.create_sensor(sensor_name) for sensor_name in sensors}
+        self.snapshot = MemberSnapshot.of(self)
+
+    def create_sensor(self, attr: str) -> MeteredSensorEntity:
+        """Create the sub-entity of an attribute."""
+        if attr in SESSION_SENSORS:
+            return MemberSessionSensor(self, attr)
+        return GenericSensor(sensor=self, attr=attr, disabled_default=self.entities_disabled_default)
+
+    def sub_entity_unique_id(self, attr: str) -> str:
+        """Return the unique ID of the sub-entity of an attribute, whether or not it was created."""
+        return self.unique_id + "_" + attr
+
+    async def async_added_to_hass(self) -> None:
+        """Show the state written before Home Assistant stopped, until the member is seen on Discord."""
+        await super().async_added_to_hass()
+        state = await self.async_get_last_state()
+        if state is None or state.state in (STATE_UNAVAILABLE, STATE_UNKNOWN):
+            return
+        attributes = dict(self.snapshot.attributes)
+        for name, attr in STATE_ATTRIBUTES:
+            if attr not in UNRESTORED_MEMBER_VALUES and name in state.attributes:
+                attributes[name] = state.attributes[name]
+        self.snapshot = MemberSnapshot(self.presence, self.member, state.state, attributes, restored=True)
+
+    def async_write_changed_states(self, force: bool = False) -> set:
+        """Write this entity and the sub-entities whose value changed since the last write.
+
+        Returns the set of changed attribute names. With force, every entity is written.
+        """
+        previous = self.snapshot
+        snapshot = MemberSnapshot.of(self, previous)
+        changed = snapshot.changes(previous)
+        # The first live values replace restored ones even when they are the same
+        if changed or previous.restored:
+            self.snapshot = snapshot
+            if ("game" in changed or previous.restored) and self.playing is not None:
+                game = self.presence.game
+                if self.playing.move(self.userid, game.name if game else None, game.appid if game else None):
+                    if self.playing.hass is not None:
+                        self.playing.async_schedule_update_ha_state(False)
+        # Sessions are closed while the bot is disconnected, the first write once it is back opens them again
+        if self.available and self.sessions.observe(self.presence):
+            changed.update(SESSION_SENSORS)
+        if not changed and not force:
+            return changed
+
+        # Playtime sensors have their own entities, sessions opening or closing alone don't change this one
+        if self.hass is not None and (force or not changed <= SESSION_SENSORS.keys()):
+            self.async_schedule_update_ha_state(False)
+        # A renamed member changes the name of every sub-entity
+        if force or "member" in changed:
+            sensors = self.sensors.values()
+        else:
+            sensors = [self.sensors[attr] for attr in changed if attr in self.sensors]
+        for sensor in sensors:
+            if sensor.hass is not None:
+                sensor.async_schedule_update_ha_state(False)
+        return changed
 
     @property
     def device_info(self) -> DeviceInfo:
@@ -662,7 +778,7 @@ class DiscordAsyncMemberState(SensorEntity):
 
     @property
     def available(self) -> bool:
-        return getattr(self.client, '_dc_game_connected', False)
+        return self.client.available
 
     @property
     def should_poll(self) -> bool:
@@ -670,7 +786,7 @@ class DiscordAsyncMemberState(SensorEntity):
 
     @property
     def native_value(self) -> str:
-        return self._state
+        return self.snapshot.state
 
     @property
     def unique_id(self):
@@ -683,73 +799,20 @@ class DiscordAsyncMemberState(SensorEntity):
 
     @property
     def entity_picture(self):
-        return self.avatar_url
+        return self.snapshot.attributes["avatar_url"]
 
     @property
     def extra_state_attributes(self):
         """Return the state attributes."""
-        return {
-            'avatar_url': self.avatar_url,
-            'activity_state': self.activity_state,
-            'user_id': str(self.userid),
-            'user_name': self.user_name,
-            'display_name': self.display_name,
-            'desktop_status': self.desktop_status,
-            'mobile_status': self.mobile_status,
-            'web_status': self.web_status,
-            'roles': self.roles,
-            'game': self.game,
-            'game_state': self.game_state,
-            'game_details': self.game_details,
-            'game_image_small': self.game_image_small,
-            'game_image_large': self.game_image_large,
-            'game_image_small_text': self.game_image_small_text,
-            'game_image_large_text': self.game_image_large_text,
-            'game_image_capsule_231x87': self.game_image_capsule_231x87,
-            'game_image_capsule_467x181': self.game_image_capsule_467x181,
-            'game_image_capsule_616x353': self.game_image_capsule_616x353,
-            'game_image_header': self.game_image_header,
-            'game_image_hero_capsule': self.game_image_hero_capsule,
-            'game_image_library_600x900': self.game_image_library_600x900,
-            'game_image_library_hero': self.game_image_library_hero,
-            'game_image_logo': self.game_image_logo,
-            'game_image_page_bg_raw': self.game_image_page_bg_raw,
-            'streaming': self.streaming,
-            'streaming_url': self.streaming_url,
-            'streaming_details': self.streaming_details,
-            'listening': self.listening,
-            'listening_url': self.listening_url,
-            'listening_details': self.listening_details,
-            'spotify_artist': self.spotify_artists,
-            'spotify_title': self.spotify_title,
-            'spotify_album': self.spotify_album,
-            'spotify_album_cover_url': self.spotify_album_cover_url,
-            'spotify_track_id': self.spotify_track_id,
-            'spotify_duration': self.spotify_duration,
-            'spotify_start': self.spotify_start,
-            'spotify_end': self.spotify_end,
-            'watching': self.watching,
-            'watching_url': self.watching_url,
-            'watching_details': self.watching_details,
-            'custom_status': self.custom_status,
-            'custom_emoji': self.custom_emoji,
-            'voice_channel': self.voice_channel,
-            'voice_server_deafened': self.voice_deaf,
-            'voice_server_muted': self.voice_mute,
-            'voice_self_deafened': self.voice_self_deaf,
-            'voice_self_muted': self.voice_self_mute,
-            'voice_streaming': self.voice_self_stream,
-            'voice_broadcasting_video': self.voice_self_video,
-            'voice_afk': self.voice_afk
-        }
+        return self.snapshot.attributes
 
 
-class GenericSensor(SensorEntity):
+class GenericSensor(MeteredSensorEntity):
     def __init__(self, sensor: DiscordAsyncMemberState, attr: str, disabled_default: bool = False):
         self.sensor = sensor
         self.attr = attr
         self._attr_entity_registry_enabled_default = not disabled_default
-        self.entity_id = ENTITY_ID_FORMAT.format(self.sensor.userid) + "_" + self.attr
+        self.entity_id = self.sensor.sub_entity_unique_id(self.attr)
 
     @property
     def available(self) -> bool:
@@ -761,12 +824,12 @@ class GenericSensor(SensorEntity):
 
     @property
     def native_value(self) -> str:
-        return getattr(self.sensor, self.attr)
+        return self.sensor.snapshot.value(self.attr)
 
     @property
     def unique_id(self):
         """Return a unique ID."""
-        return ENTITY_ID_FORMAT.format(self.sensor.userid) + "_" + self.attr
+        return self.sensor.sub_entity_unique_id(self.attr)
 
     @property
     def name(self):
@@ -774,11 +837,109 @@ class GenericSensor(SensorEntity):
 
     @property
     def entity_picture(self):
-        attr = getattr(self.sensor, self.attr)
-        if validators.url(attr):
-            return attr
+        snapshot = self.sensor.snapshot
+        if self.attr in snapshot.urls:
+            return snapshot.value(self.attr)
+        return None
+
+    @property
+    def device_info(self) -> DeviceInfo:
+        """Return the device info."""
+        return DeviceInfo(
+            identifiers={(DOMAIN, self.sensor.member)},
+            name=self.sensor.member
+        )
+
+
+class RecorderFriendlyMemberState(DiscordAsyncMemberState):
+    """Member state that keeps its volatile attributes out of the recorder.
+
+    Its Spotify time sub-entities are timestamp and duration sensors instead of text.
+    """
+
+    _unrecorded_attributes = frozenset(name for name, _ in STATE_ATTRIBUTES) - RECORDED_MEMBER_ATTRIBUTES
+
+    def create_sensor(self, attr: str) -> MeteredSensorEntity:
+        """Create the sub-entity of an attribute."""
+        if attr in ("spotify_start", "spotify_end"):
+            return SpotifyTimestampSensor(sensor=self, attr=attr, disabled_default=self.entities_disabled_default)
+        if attr == "spotify_duration":
+            return SpotifyDurationSensor(sensor=self, attr=attr, disabled_default=self.entities_disabled_default)
+        return super().create_sensor(attr)
+
+
+class SpotifyTimestampSensor(GenericSensor):
+    """Start or end of the Spotify track of a member."""
+
+    _attr_device_class = SensorDeviceClass.TIMESTAMP
+
+    @property
+    def native_value(self) -> Optional[datetime]:
+        spotify = self.sensor.snapshot.presence.spotify
+        if spotify is None:
+            return None
+        return spotify.start if self.attr == "spotify_start" else spotify.end
+
+    @property
+    def entity_picture(self):
         return None
 
+
+class SpotifyDurationSensor(GenericSensor):
+    """Length of the Spotify track of a member."""
+
+    _attr_device_class = SensorDeviceClass.DURATION
+    _attr_native_unit_of_measurement = UnitOfTime.SECONDS
+
+    @property
+    def native_value(self) -> Optional[float]:
+        spotify = self.sensor.snapshot.presence.spotify
+        return spotify.duration.total_seconds() if spotify is not None else None
+
+    @property
+    def entity_picture(self):
+        return None
+
+
+class MemberSessionSensor(MeteredSensorEntity):
+    """Minutes a member spent in a game, in voice or online within a rolling window.
+
+    Disabled by default, it is polled and its state is kept in the long-term statistics.
+    """
+
+    _attr_device_class = SensorDeviceClass.DURATION
+    _attr_native_unit_of_measurement = UnitOfTime.MINUTES
+    _attr_state_class = SensorStateClass.MEASUREMENT
+    _attr_entity_registry_enabled_default = False
+
+    def __init__(self, sensor: DiscordAsyncMemberState, attr: str):
+        self.sensor = sensor
+        self.attr = attr
+        self._kind, self._window = SESSION_SENSORS[attr]
+        self.entity_id = self.sensor.sub_entity_unique_id(self.attr)
+
+    @property
+    def available(self) -> bool:
+        return self.sensor.available
+
+    @property
+    def should_poll(self) -> bool:
+        # The open session keeps growing and old sessions leave the window without any Discord event
+        return True
+
+    @property
+    def native_value(self) -> float:
+        return round(self.sensor.sessions.total(self._kind, self._window) / 60, 1)
+
+    @property
+    def unique_id(self):
+        """Return a unique ID."""
+        return self.sensor.sub_entity_unique_id(self.attr)
+
+    @property
+    def name(self):
+        return self.sensor.member + " " + self.attr
+
     @property
     def device_info(self) -> DeviceInfo:
         """Return the device info."""
@@ -787,8 +948,17 @@ class GenericSensor(SensorEntity):
             name=self.sensor.member
         )
 
+    @property
+    def extra_state_attributes(self):
+        """Return the state attributes."""
+        current = self.sensor.sessions.current(self._kind)
+        return {
+            'current': current[0] if current is not None else None,
+            'current_since': dt_util.utc_from_timestamp(current[1]).isoformat() if current is not None else None,
+        }
 
-class DiscordAsyncReactionState(SensorEntity):
+
+class DiscordAsyncReactionState(MeteredSensorEntity, RestoreEntity):
     def __init__(self, hass, client, channel, channelid):
         self._channel_name = channel
         self._channel_id = channelid
@@ -798,9 +968,17 @@ class DiscordAsyncReactionState(SensorEntity):
         self._last_user = None
         self.entity_id = ENTITY_ID_CHANNEL_FORMAT.format(self._channel_id)
 
+    async def async_added_to_hass(self) -> None:
+        """Show the last reaction from before Home Assistant stopped."""
+        await super().async_added_to_hass()
+        state = await self.async_get_last_state()
+        if state is not None and state.state not in (STATE_UNAVAILABLE, STATE_UNKNOWN):
+            self._state = state.state
+            self._last_user = state.attributes.get('last_user')
+
     @property
     def available(self) -> bool:
-        return getattr(self._client, '_dc_game_connected', False)
+        return self._client.available
 
     @property
     def should_poll(self) -> bool:
@@ -835,24 +1013,113 @@ class DiscordAsyncReactionState(SensorEntity):
         }
 
 
-class DiscordAsyncVoiceChannelState(SensorEntity):
-    def __init__(self, hass, client, channel, channelid, entities_disabled_default=False):
+@dataclasses.dataclass(slots=True, frozen=True)
+class VoiceRosterEntry:
+    """A member in a voice channel."""
+
+    display_name: str
+    name: str
+    # When the member was seen joining, None if already in the channel when the roster was loaded
+    joined: Optional[datetime] = None
+
+
+class DiscordAsyncVoiceChannelState(MeteredSensorEntity, RestoreEntity):
+    def __init__(self, hass, client, channel, channelid, entities_disabled_default=False, sensors=VOICE_CHANNEL_SENSORS):
         self._channel_name = channel
         self._channel_id = channelid
         self._hass = hass
         self._client = client
-        self._user_count = 0
-        self._members = []
-        self._member_usernames = []
+        # Member id -> VoiceRosterEntry, in join order
+        self._roster: dict[int, VoiceRosterEntry] = {}
+        self._refresh_roster()
         self.entity_id = ENTITY_ID_VOICE_CHANNEL_FORMAT.format(self._channel_id)
-        self.sensors = {
-            "display_names": VoiceChannelMembersSensor(self, "display_names", entities_disabled_default),
-            "usernames": VoiceChannelMembersSensor(self, "usernames", entities_disabled_default),
+        self.entities_disabled_default = entities_disabled_default
+        self.sensors = {sensor_name: self.create_sensor(sensor_name) for sensor_name in sensors}
+
+    def create_sensor(self, attr: str) -> "VoiceChannelMembersSensor":
+        """Create the sub-entity of an attribute."""
+        return VoiceChannelMembersSensor(self, attr, self.entities_disabled_default)
+
+    def _refresh_roster(self) -> None:
+        # Everything derived from the roster is rebuilt on changes only, reads use these as they are
+        entries = self._roster.values()
+        self._user_count = len(self._roster)
+        self._members = [entry.display_name for entry in entries]
+        self._member_usernames = [entry.name for entry in entries]
+        self._joined_at = {entry.name: entry.joined.isoformat() if entry.joined is not None else None
+                           for entry in entries}
+        self._joined_names = {"display_names": ", ".join(self._members), "usernames": ", ".join(self._member_usernames)}
+
+    def reset_roster(self, members) -> bool:
+        """Load the roster from the members in the channel, keeping the join times of the known ones.
+
+        Returns whether the roster changed.
+        """
+        previous = self._roster
+        self._roster = {
+            member.id: VoiceRosterEntry(member.display_name, member.name,
+                                        previous[member.id].joined if member.id in previous else None)
+            for member in members
         }
+        if self._roster == previous:
+            return False
+        self._refresh_roster()
+        return True
+
+    def add_member(self, member: Member) -> bool:
+        """Add a member that joined the channel or update its names, return whether the roster changed."""
+        entry = self._roster.get(member.id)
+        if entry is None:
+            self._roster[member.id] = VoiceRosterEntry(member.display_name, member.name, dt_util.utcnow())
+        elif entry.display_name != member.display_name or entry.name != member.name:
+            self._roster[member.id] = dataclasses.replace(entry, display_name=member.display_name, name=member.name)
+        else:
+            return False
+        self._refresh_roster()
+        return True
+
+    def remove_member(self, member_id: int) -> bool:
+        """Remove a member that left the channel, return whether it was in the roster."""
+        if self._roster.pop(member_id, None) is None:
+            return False
+        self._refresh_roster()
+        return True
+
+    async def async_added_to_hass(self) -> None:
+        """Load the roster from before Home Assistant stopped, the next reset_roster replaces it."""
+        await super().async_added_to_hass()
+        extra_data = await self.async_get_last_extra_data()
+        if extra_data is None:
+            return
+        self._roster = {
+            member_id: VoiceRosterEntry(display_name, name, dt_util.parse_datetime(joined) if joined else None)
+            for member_id, display_name, name, joined in extra_data.as_dict().get("roster", [])
+        }
+        self._refresh_roster()
+
+    @property
+    def extra_restore_state_data(self) -> RestoredExtraData:
+        """Return the roster to restore, with the member ids the state attributes don't show."""
+        return RestoredExtraData({"roster": [
+            [member_id, entry.display_name, entry.name, entry.joined.isoformat() if entry.joined is not None else None]
+            for member_id, entry in self._roster.items()
+        ]})
+
+    def async_write_roster(self) -> None:
+        """Write this entity and its sub-entities after a roster change."""
+        if self.hass is not None:
+            self.async_schedule_update_ha_state(False)
+        for sensor in self.sensors.values():
+            if sensor.hass is not None:
+                sensor.async_schedule_update_ha_state(False)
+
+    def sub_entity_unique_id(self, attr: str) -> str:
+        """Return the unique ID of the sub-entity of an attribute, whether or not it was created."""
+        return self.unique_id + "_" + attr
 
     @property
     def available(self) -> bool:
-        return getattr(self._client, '_dc_game_connected', False)
+        return self._client.available
 
     @property
     def should_poll(self) -> bool:
@@ -884,16 +1151,17 @@ class DiscordAsyncVoiceChannelState(SensorEntity):
         """Return the state attributes."""
         return {
             'members': self._members,
-            'member_usernames': self._member_usernames
+            'member_usernames': self._member_usernames,
+            'joined_at': self._joined_at,
         }
 
 
-class VoiceChannelMembersSensor(SensorEntity):
+class VoiceChannelMembersSensor(MeteredSensorEntity):
     def __init__(self, voice_channel: DiscordAsyncVoiceChannelState, attr: str, disabled_default: bool = False):
         self.voice_channel = voice_channel
         self.attr = attr
         self._attr_entity_registry_enabled_default = not disabled_default
-        self.entity_id = ENTITY_ID_VOICE_CHANNEL_FORMAT.format(self.voice_channel._channel_id) + "_" + self.attr
+        self.entity_id = self.voice_channel.sub_entity_unique_id(self.attr)
 
     @property
     def available(self) -> bool:
@@ -905,14 +1173,12 @@ class VoiceChannelMembersSensor(SensorEntity):
 
     @property
     def native_value(self) -> str:
-        if self.attr == "display_names":
-            return ", ".join(self.voice_channel._members) if self.voice_channel._members else ""
-        return ", ".join(self.voice_channel._member_usernames) if self.voice_channel._member_usernames else ""
+        return self.voice_channel._joined_names[self.attr]
 
     @property
     def unique_id(self):
         """Return a unique ID."""
-        return ENTITY_ID_VOICE_CHANNEL_FORMAT.format(self.voice_channel._channel_id) + "_" + self.attr
+        return self.voice_channel.sub_entity_unique_id(self.attr)
 
     @property
     def name(self):
@@ -925,3 +1191,358 @@ class VoiceChannelMembersSensor(SensorEntity):
             identifiers={(DOMAIN, self.voice_channel.unique_id)},
             name=self.voice_channel._channel_name
         )
+
+
+class DiscordGuildVoiceOverview(MeteredSensorEntity):
+    """Number of members in the voice channels of a guild, with the occupancy of each channel."""
+
+    def __init__(self, hass, client, guild, guildid):
+        self._guild_name = guild
+        self._guild_id = guildid
+        self._hass = hass
+        self._client = client
+        # Occupied channel id -> members in it, and its name
+        self._counts: dict[int, int] = {}
+        self._channel_names: dict[int, str] = {}
+        self._total = 0
+        self._refresh()
+        self.entity_id = ENTITY_ID_VOICE_OVERVIEW_FORMAT.format(self._guild_id)
+
+    def _refresh(self) -> None:
+        # Attributes are rebuilt on changes only, from the occupied channels
+        busiest = max(self._counts, key=self._counts.get, default=None)
+        self._attributes = {
+            'occupied_channels': len(self._counts),
+            'busiest_channel': self._channel_names[busiest] if busiest is not None else None,
+            'busiest_channel_members': self._counts[busiest] if busiest is not None else 0,
+            'channels': {self._channel_names[channel_id]: count for channel_id, count in
+                         sorted(self._counts.items(), key=lambda item: item[1], reverse=True)},
+        }
+
+    def reset(self, guild: Guild) -> bool:
+        """Load the occupancy of every voice and stage channel from the voice states of the guild.
+
+        Returns whether the occupancy changed.
+        """
+        previous = self._counts, self._channel_names
+        self._counts, self._channel_names = {}, {}
+        for channel in (*guild.voice_channels, *guild.stage_channels):
+            if channel.voice_states:
+                self._counts[channel.id] = len(channel.voice_states)
+                self._channel_names[channel.id] = channel.name
+        if (self._counts, self._channel_names) == previous:
+            return False
+        self._total = sum(self._counts.values())
+        self._refresh()
+        return True
+
+    def apply_voice_update(self, before: Optional[GuildChannel], after: Optional[GuildChannel]) -> bool:
+        """Move a member between the channels of a voice state update, return whether the occupancy changed."""
+        if (before.id if before is not None else None) == (after.id if after is not None else None):
+            return False
+        if before is not None and before.id in self._counts:
+            self._total -= 1
+            self._counts[before.id] -= 1
+            if not self._counts[before.id]:
+                del self._counts[before.id]
+                del self._channel_names[before.id]
+        if after is not None:
+            self._total += 1
+            self._counts[after.id] = self._counts.get(after.id, 0) + 1
+            self._channel_names[after.id] = after.name
+        self._refresh()
+        return True
+
+    @property
+    def available(self) -> bool:
+        return self._client.available
+
+    @property
+    def should_poll(self) -> bool:
+        return False
+
+    @property
+    def native_value(self) -> int:
+        return self._total
+
+    @property
+    def unique_id(self):
+        """Return a unique ID."""
+        return ENTITY_ID_VOICE_OVERVIEW_FORMAT.format(self._guild_id)
+
+    @property
+    def name(self):
+        return self._guild_name + " voice"
+
+    @property
+    def device_info(self) -> DeviceInfo:
+        """Return the device info."""
+        return DeviceInfo(
+            identifiers={(DOMAIN, self.unique_id)},
+            name=self._guild_name
+        )
+
+    @property
+    def extra_state_attributes(self):
+        """Return the state attributes."""
+        return self._attributes
+
+
+# Statuses counted by the role aggregates, invisible members show up as offline to the bot
+ROLE_STATUSES = ("online", "idle", "dnd", "offline")
+ROLE_ONLINE_STATUSES = ROLE_STATUSES[:3]
+
+# Every possible (status, in voice, playing) entry, members with the same entry share the tuple
+_ROLE_MEMBER_ENTRIES = {entry: entry for entry in itertools.product(ROLE_STATUSES, (False, True), (False, True))}
+
+
+def role_member_entry(member: Member, in_voice: bool = None) -> tuple:
+    """Return the (status, in voice, playing) entry of a role member, in_voice overrides the cached voice state."""
+    status = str(member.status)
+    if in_voice is None:
+        in_voice = member.voice is not None and member.voice.channel is not None
+    playing = any(activity.type == ActivityType.playing for activity in member.activities)
+    return _ROLE_MEMBER_ENTRIES[status if status in ROLE_STATUSES else "offline", in_voice, playing]
+
+
+class DiscordRoleAggregate(MeteredSensorEntity):
+    """Number of online members of a guild role, with counts per status, in voice and playing.
+
+    Only one shared entry per member is kept, an update moves the counters from the previous entry of
+    the member to the new one, whatever the size of the role.
+    """
+
+    def __init__(self, hass, client, guild, role, roleid):
+        self._guild_name = guild
+        self._role_name = role
+        self._role_id = roleid
+        self._hass = hass
+        self._client = client
+        self._members: dict[int, tuple] = {}  # member id -> (status, in voice, playing)
+        self._counts = dict.fromkeys(ROLE_STATUSES, 0)
+        self._in_voice = 0
+        self._playing = 0
+        self.entity_id = ENTITY_ID_ROLE_FORMAT.format(self._role_id)
+
+    def _count(self, entry: tuple, delta: int) -> None:
+        status, in_voice, playing = entry
+        self._counts[status] += delta
+        self._in_voice += delta if in_voice else 0
+        self._playing += delta if playing else 0
+
+    def reset(self, members) -> bool:
+        """Load the entries of all members of the role, return whether the counts changed."""
+        previous = self._members, self._counts, self._in_voice, self._playing
+        self._members = {}
+        self._counts = dict.fromkeys(ROLE_STATUSES, 0)
+        self._in_voice = self._playing = 0
+        for member in members:
+            self.apply(member.id, role_member_entry(member))
+        return (self._counts, self._in_voice, self._playing) != previous[1:]
+
+    def apply(self, member_id: int, entry: tuple) -> bool:
+        """Set the entry of a member, return whether the counts changed."""
+        previous = self._members.get(member_id)
+        if previous is entry:
+            return False
+        if previous is not None:
+            self._count(previous, -1)
+        self._members[member_id] = entry
+        self._count(entry, 1)
+        return True
+
+    def discard(self, member_id: int) -> bool:
+        """Drop a member that lost the role or left the guild, return whether it was counted."""
+        previous = self._members.pop(member_id, None)
+        if previous is None:
+            return False
+        self._count(previous, -1)
+        return True
+
+    @property
+    def available(self) -> bool:
+        return self._client.available
+
+    @property
+    def should_poll(self) -> bool:
+        return False
+
+    @property
+    def native_value(self) -> int:
+        return sum(self._counts[status] for status in ROLE_ONLINE_STATUSES)
+
+    @property
+    def unique_id(self):
+        """Return a unique ID."""
+        return ENTITY_ID_ROLE_FORMAT.format(self._role_id)
+
+    @property
+    def name(self):
+        return f"{self._guild_name} {self._role_name}"
+
+    @property
+    def device_info(self) -> DeviceInfo:
+        """Return the device info."""
+        return DeviceInfo(
+            identifiers={(DOMAIN, self.unique_id)},
+            name=f"{self._guild_name} {self._role_name}"
+        )
+
+    @property
+    def extra_state_attributes(self):
+        """Return the state attributes."""
+        return {
+            'members': len(self._members),
+            **self._counts,
+            'in_voice': self._in_voice,
+            'playing': self._playing,
+        }
+
+
+class DiscordPlayingIndex(MeteredSensorEntity):
+    """Number of watched members playing a game, with the members playing each game.
+
+    The member states move their member between games when their game changes, so the index is never
+    rebuilt from the member entities.
+    """
+
+    _unrecorded_attributes = frozenset({"games"})
+
+    def __init__(self, hass, client, entry_id):
+        self._hass = hass
+        self._client = client
+        self._entry_id = entry_id
+        self._players: dict[str, set[int]] = {}  # game -> ids of the members playing it
+        self._appids: dict[str, Optional[int]] = {}  # game -> Steam appid
+        self._games: dict[int, str] = {}  # member id -> game
+        self._refresh()
+
+    def _refresh(self) -> None:
+        # Attributes are rebuilt on changes only, the most played games first
+        games = sorted(self._players.items(), key=lambda item: len(item[1]), reverse=True)
+        self._attributes = {
+            'top_game': games[0][0] if games else None,
+            'top_game_members': len(games[0][1]) if games else 0,
+            'games': {game: {'appid': self._appids[game], 'count': len(member_ids),
+                             'members': sorted(str(member_id) for member_id in member_ids)}
+                      for game, member_ids in games},
+        }
+
+    def move(self, member_id: int, game: Optional[str], appid: Optional[int] = None) -> bool:
+        """Move a member to the game it plays now, None when it stopped playing. Return whether the index changed."""
+        previous = self._games.get(member_id)
+        if previous == game:
+            return False
+        if previous is not None:
+            players = self._players[previous]
+            players.discard(member_id)
+            if not players:
+                del self._players[previous]
+                del self._appids[previous]
+            del self._games[member_id]
+        if game is not None:
+            self._players.setdefault(game, set()).add(member_id)
+            self._appids[game] = appid
+            self._games[member_id] = game
+        self._refresh()
+        return True
+
+    @property
+    def available(self) -> bool:
+        return self._client.available
+
+    @property
+    def should_poll(self) -> bool:
+        return False
+
+    @property
+    def native_value(self) -> int:
+        return len(self._games)
+
+    @property
+    def unique_id(self):
+        """Return a unique ID."""
+        return f"discord_game_{self._entry_id}_playing"
+
+    @property
+    def name(self):
+        return "Discord Game playing"
+
+    @property
+    def device_info(self) -> DeviceInfo:
+        """Return the device info."""
+        return DeviceInfo(
+            identifiers={(DOMAIN, f"{self._entry_id}_bot")},
+            name="Discord Game"
+        )
+
+    @property
+    def extra_state_attributes(self):
+        """Return the state attributes."""
+        return self._attributes
+
+
+class DiscordGameMetricsSensor(MeteredSensorEntity):
+    """Diagnostic sensor with the integration performance counters, disabled by default."""
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_entity_registry_enabled_default = False
+    _attr_state_class = SensorStateClass.TOTAL_INCREASING
+    _attr_native_unit_of_measurement = "events"
+    _unrecorded_attributes = frozenset({"handlers"})
+
+    def __init__(self, hass, client, entry_id, metrics: IntegrationMetrics):
+        self._hass = hass
+        self._client = client
+        self._entry_id = entry_id
+        self._metrics = metrics
+
+    @property
+    def available(self) -> bool:
+        return self._client.available
+
+    @property
+    def should_poll(self) -> bool:
+        return True
+
+    @property
+    def native_value(self) -> int:
+        return self._metrics.events
+
+    @property
+    def unique_id(self):
+        """Return a unique ID."""
+        return f"discord_game_{self._entry_id}_metrics"
+
+    @property
+    def name(self):
+        return "Discord Game metrics"
+
+    @property
+    def device_info(self) -> DeviceInfo:
+        """Return the device info."""
+        return DeviceInfo(
+            identifiers={(DOMAIN, f"{self._entry_id}_bot")},
+            name="Discord Game"
+        )
+
+    @property
+    def extra_state_attributes(self):
+        """Return the state attributes."""
+        metrics = self._metrics.as_dict()
+        steam_catalog = self._hass.data.get(DATA_STEAM_CATALOG)
+        steam_artwork = self._hass.data.get(DATA_STEAM_ARTWORK)
+        asset_urls = self._hass.data.get(DATA_ASSET_URLS)
+        return {
+            'state_writes': metrics["state_writes"],
+            'reconnects': metrics["reconnects"],
+            'resumes': metrics["resumes"],
+            'steam_catalog_apps': len(steam_catalog) if steam_catalog is not None else None,
+            'steam_catalog_load_duration': steam_catalog.load_duration if steam_catalog is not None else None,
+            'steam_head_probes': steam_artwork.probes if steam_artwork is not None else None,
+            'steam_artwork_cache_hits': steam_artwork.hits if steam_artwork is not None else None,
+            'asset_url_cache_hits': asset_urls.hits if asset_urls is not None else None,
+            'asset_url_cache_misses': asset_urls.misses if asset_urls is not None else None,
+            'handlers': {name: {"count": stats["count"], "avg_ms": stats["avg_ms"], "max_ms": stats["max_ms"]}
+                         for name, stats in metrics["handlers"].items()},
+        }
@@ -0,0 +1,170 @@
+"""Game, voice and online sessions of the watched members, for playtime totals without recorder queries."""
+import time
+from collections import deque
+from typing import Iterable, Optional
+
+from homeassistant import core
+from homeassistant.const import EVENT_HOMEASSISTANT_STOP
+from homeassistant.helpers.storage import Store
+
+from .const import DOMAIN
+from .presence import MemberPresence
+
+SESSIONS_STORAGE_KEY = f"{DOMAIN}.sessions.{{}}"
+SESSIONS_STORAGE_VERSION = 1
+SESSIONS_SAVE_DELAY = 60  # seconds
+
+SESSION_KINDS = ("game", "voice", "online")
+ONLINE_STATUSES = frozenset({"online", "idle", "dnd"})
+
+DAY = 24 * 60 * 60  # seconds
+WEEK = 7 * DAY
+
+# Closed sessions are kept until they end this long ago, the longest window of the playtime sensors
+SESSION_HISTORY_AGE = WEEK
+
+
+def session_names(presence: MemberPresence) -> tuple:
+    """Return the game, voice channel and online status of a presence, in SESSION_KINDS order."""
+    return (
+        presence.game.name if presence.game is not None else None,
+        presence.voice.channel if presence.voice is not None else None,
+        # Going idle or do not disturb doesn't end the online session
+        "online" if str(presence.status) in ONLINE_STATUSES else None,
+    )
+
+
+class MemberSessions:
+    """Open sessions and the closed ones of a member that ended within SESSION_HISTORY_AGE.
+
+    A session is (kind, name, start, end) with POSIX timestamps, open sessions have no end yet. Sessions are
+    closed in time order, so the oldest end is always first in the history.
+    """
+
+    __slots__ = ("open", "history", "_tracker")
+
+    def __init__(self, tracker: "SessionTracker" = None):
+        self.open: dict[str, tuple[str, float]] = {}  # kind -> (name, start)
+        self.history: deque = deque()
+        self._tracker = tracker
+
+    def observe(self, presence: MemberPresence, now: float = None) -> bool:
+        """Close and open sessions for the transitions of a presence, return whether any happened."""
+        now = time.time() if now is None else now
+        changed = False
+        for kind, name in zip(SESSION_KINDS, session_names(presence)):
+            current = self.open.get(kind)
+            if (current[0] if current is not None else None) == name:
+                continue
+            changed = True
+            if current is not None:
+                self.history.append((kind, current[0], current[1], now))
+            if name is not None:
+                self.open[kind] = (name, now)
+            else:
+                del self.open[kind]
+        if changed:
+            self.prune(now)
+            if self._tracker is not None:
+                self._tracker.async_schedule_save()
+        return changed
+
+    def prune(self, now: float) -> None:
+        """Drop the closed sessions that ended more than SESSION_HISTORY_AGE ago."""
+        history = self.history
+        while history and history[0][3] <= now - SESSION_HISTORY_AGE:
+            history.popleft()
+
+    def total(self, kind: str, window: float, now: float = None) -> float:
+        """Return the seconds spent in sessions of kind within the last window seconds."""
+        now = time.time() if now is None else now
+        since = now - window
+        total = 0.0
+        for session_kind, _, start, end in self.history:
+            if session_kind == kind and end > since:
+                total += end - max(start, since)
+        current = self.open.get(kind)
+        if current is not None:
+            total += now - max(current[1], since)
+        return total
+
+    def current(self, kind: str) -> Optional[tuple[str, float]]:
+        """Return (name, start) of the open session of kind, or None."""
+        return self.open.get(kind)
+
+    def close(self, now: float) -> None:
+        """Close the open sessions at now."""
+        for kind, (name, start) in self.open.items():
+            self.history.append((kind, name, start, now))
+        self.open.clear()
+        self.prune(now)
+
+    def as_dict(self) -> dict:
+        return {
+            "open": {kind: list(session) for kind, session in self.open.items()},
+            "history": [list(session) for session in self.history],
+        }
+
+    def load(self, data: dict) -> None:
+        self.open = {kind: tuple(session) for kind, session in data.get("open", {}).items()}
+        self.history.extend(tuple(session) for session in data.get("history", []))
+
+
+class SessionTracker:
+    """Sessions of the members of a config entry, persisted in the Home Assistant storage directory.
+
+    The tracker outlives reloads of its entry. Only a snapshot of the sessions is stored, at most once
+    per SESSIONS_SAVE_DELAY and when Home Assistant stops. Sessions that were open when the snapshot was
+    taken are closed at that time on load, nothing is known about the time Home Assistant was down.
+    """
+
+    def __init__(self, hass: core.HomeAssistant, entry_id: str):
+        self._store = Store(hass, SESSIONS_STORAGE_VERSION, SESSIONS_STORAGE_KEY.format(entry_id))
+        self._members: dict[str, MemberSessions] = {}
+        self._unsub_stop = hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, self._async_stop)
+
+    def member(self, user_id: str) -> MemberSessions:
+        """Return the sessions of a member, created on first use."""
+        sessions = self._members.get(user_id)
+        if sessions is None:
+            sessions = self._members[user_id] = MemberSessions(self)
+        return sessions
+
+    def retain(self, user_ids: Iterable[str]) -> None:
+        """Forget the members that are no longer watched."""
+        user_ids = set(user_ids)
+        for user_id in [user_id for user_id in self._members if user_id not in user_ids]:
+            del self._members[user_id]
+
+    async def async_load(self) -> None:
+        data = await self._store.async_load()
+        if not data:
+            return
+        for user_id, member_data in data["members"].items():
+            sessions = self.member(user_id)
+            sessions.load(member_data)
+            sessions.close(data["saved"])
+
+    async def async_remove(self) -> None:
+        """Delete the stored sessions, for a config entry that was deleted."""
+        if self._unsub_stop is not None:
+            self._unsub_stop()
+            self._unsub_stop = None
+        await self._store.async_remove()
+
+    @core.callback
+    def async_schedule_save(self) -> None:
+        self._store.async_delay_save(self._data, SESSIONS_SAVE_DELAY)
+
+    # noinspection PyUnusedLocal
+    @core.callback
+    def _async_stop(self, event) -> None:
+        self._unsub_stop = None
+        # The save pending at stop is written by the store on the final write, with the current sessions
+        self.async_schedule_save()
+
+    def _data(self) -> dict:
+        return {
+            "saved": time.time(),
+            "members": {user_id: sessions.as_dict() for user_id, sessions in self._members.items()},
+        }
@@ -0,0 +1,314 @@
+"""Steam store helpers shared by all Discord Game config entries."""
+import asyncio
+import logging
+import re
+import sys
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from functools import lru_cache
+
+import aiohttp
+from homeassistant import core
+from homeassistant.helpers.storage import Store
+
+from .const import DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+STEAM_APP_LIST_URL = "https://api.steampowered.com/IStoreService/GetAppList/v1/"
+STEAM_APP_LIST_TIMEOUT = aiohttp.ClientTimeout(total=90, connect=10)
+STEAM_CDN_URL = "https://cdn.cloudflare.steamstatic.com/steam/apps/{}/{}"
+STEAM_IMAGES = {
+    "game_image_capsule_231x87": "capsule_231x87.jpg",
+    "game_image_capsule_467x181": "capsule_467x181.jpg",
+    "game_image_capsule_616x353": "capsule_616x353.jpg",
+    "game_image_header": "header.jpg",
+    "game_image_hero_capsule": "hero_capsule.jpg",
+    "game_image_library_600x900": "library_600x900.jpg",
+    "game_image_library_hero": "library_hero.jpg",
+    "game_image_logo": "logo.jpg",
+    "game_image_page_bg_raw": "page_bg_raw.jpg",
+}
+STEAM_LOGO_PNG = "logo.png"
+
+CATALOG_STORAGE_KEY = f"{DOMAIN}.steam_app_catalog"
+CATALOG_STORAGE_VERSION = 1
+# A bit under the hourly refresh loop of the connection, the catalog downloaded on the previous run must be stale
+CATALOG_MAX_AGE = 55 * 60  # seconds
+
+_TRADEMARK_SYMBOLS = str.maketrans("", "", "™®©℠")
+_NON_WORD = re.compile(r"[\W_]+")
+_EDITION_SUFFIX = re.compile(
+    r"(?:\s+(?:game of the year|goty|definitive|deluxe|digital deluxe|complete|ultimate|gold|standard|enhanced|"
+    r"remastered|anniversary|special|collectors|collector s|premium))?\s+edition$"
+)
+
+LOOKUP_CACHE_SIZE = 256
+
+ARTWORK_CACHE_SIZE = 512
+ARTWORK_CACHE_TTL = 6 * 60 * 60  # seconds
+ARTWORK_PROBE_TIMEOUT = aiohttp.ClientTimeout(total=10, connect=5)
+
+
+class SteamAppCatalog:
+    """Steam app catalog (name -> appid) persisted in the Home Assistant storage directory.
+
+    The catalog is loaded from disk at startup and refreshed from the Steam Web API in the background,
+    so restarts neither wait for nor depend on Steam.
+    """
+
+    def __init__(self, hass: core.HomeAssistant, session: aiohttp.ClientSession):
+        self._hass = hass
+        self._session = session
+        self._store = Store(hass, CATALOG_STORAGE_VERSION, CATALOG_STORAGE_KEY)
+        self._lock = asyncio.Lock()
+        self._loaded = False
+        self._index = SteamAppIndex()
+        self.updated: float = 0
+        self.load_duration: float = None
+        self.download_duration: float = None
+
+    def __len__(self):
+        return len(self._index)
+
+    def get_appid(self, name: str):
+        """Return the appid of the game called name, or None."""
+        return self._index.get(name)
+
+    async def async_load(self) -> None:
+        """Load the stored catalog, once."""
+        async with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            start = time.perf_counter()
+            data = await self._store.async_load()
+            if not data:
+                return
+            self._index = await self._hass.async_add_executor_job(SteamAppIndex.build, data["appids"], data["names"])
+            self.updated = data["updated"]
+            self.load_duration = time.perf_counter() - start
+            _LOGGER.debug("Loaded stored Steam app catalog, total apps: %s", len(self))
+
+    async def async_refresh(self, api_key: str) -> None:
+        """Download the catalog from Steam and store it, unless the current one is recent enough."""
+        await self.async_load()
+        async with self._lock:
+            if time.time() - self.updated < CATALOG_MAX_AGE:
+                return
+            # The age counts from the start of the download, as the refresh loop runs do
+            fetched = time.time()
+            start = time.perf_counter()
+            catalog = await self._async_fetch(api_key)
+            if catalog is None:
+                return
+            self.download_duration = time.perf_counter() - start
+            appids, names = catalog
+            self._index = await self._hass.async_add_executor_job(SteamAppIndex.build, appids, names)
+            self.updated = fetched
+            await self._store.async_save({"updated": self.updated, "appids": appids, "names": names})
+            _LOGGER.debug("Loading Steam detectable applications finished, total apps: %s", len(self))
+
+    def as_dict(self) -> dict:
+        """Return the catalog diagnostics."""
+        return {
+            "apps": len(self),
+            "updated": self.updated,
+            "load_duration_s": self.load_duration,
+            "download_duration_s": self.download_duration,
+        }
+
+    async def _async_fetch(self, api_key: str):
+        """Page through IStoreService/GetAppList, return (appids, names) or None on failure."""
+        _LOGGER.debug("Loading Steam detectable applications")
+        appids = []
+        names = []
+        last_appid = 0
+        have_more = True
+        try:
+            while have_more:
+                params = {
+                    "key": api_key,
+                    "max_results": 50000,
+                    "include_dlc": "false",
+                    "include_videos": "false",
+                    "include_hardware": "false",
+                }
+                if last_appid > 0:
+                    params["last_appid"] = last_appid
+                async with self._session.get(STEAM_APP_LIST_URL, params=params, timeout=STEAM_APP_LIST_TIMEOUT) as steam_response:
+                    if steam_response.status != 200:
+                        _LOGGER.error("Error loading Steam detectable applications, status=%s", steam_response.status)
+                        return None
+                    response = (await steam_response.json()).get('response', {})
+                apps = response.get('apps', [])
+                for app in apps:
+                    if 'name' in app:
+                        appids.append(app['appid'])
+                        names.append(app['name'])
+                have_more = response.get('have_more_results', False)
+                if have_more and apps:
+                    last_appid = apps[-1].get('appid', 0)
+                else:
+                    have_more = False
+        except asyncio.TimeoutError:
+            _LOGGER.error("Timeout while loading Steam detectable applications")
+            return None
+        except aiohttp.ClientError as err:
+            _LOGGER.error("Error loading Steam detectable applications: %s", err)
+            return None
+        return appids, names
+
+
+def normalize_game_name(name: str) -> str:
+    """Return the form of a game name used to match Discord activities with Steam apps.
+
+    Casing, accents, trademark symbols, punctuation and edition suffixes are ignored,
+    so "DOOM Eternal™" and "Doom Eternal - Deluxe Edition" both become "doom eternal".
+    """
+    name = name.translate(_TRADEMARK_SYMBOLS).casefold()
+    if not name.isascii():
+        name = "".join(c for c in unicodedata.normalize("NFKD", name) if not unicodedata.combining(c))
+    name = _NON_WORD.sub(" ", name).strip()
+    return _EDITION_SUFFIX.sub("", name)
+
+
+class SteamAppIndex:
+    """Compact name -> appid lookups over the Steam app catalog.
+
+    Exact names win, otherwise a name is matched by its normalize_game_name() form.
+    When several apps share a name, the lowest appid wins.
+
+    Normalized names are only kept as their hashes, in a sorted array('q') next to an array('I')
+    of appids. The few exact names that resolve to another app than their normalized form are
+    kept in a dict. Results are memoized, Discord reports the same few games over and over.
+    """
+
+    def __init__(self, size: int = 0, hashes: array = None, appids: array = None, exact: dict = None):
+        self._size = size
+        self._hashes = hashes if hashes is not None else array('q')
+        self._appids = appids if appids is not None else array('I')
+        self._exact = exact or {}
+        self.get = lru_cache(maxsize=LOOKUP_CACHE_SIZE)(self._lookup)
+
+    def __len__(self):
+        return self._size
+
+    @classmethod
+    def build(cls, appids: list, names: list) -> "SteamAppIndex":
+        """Build the index from parallel appid/name lists, runs in the executor."""
+        exact = {}
+        normalized = {}
+        for appid, name in zip(appids, names):
+            key = normalize_game_name(name)
+            if name not in exact or exact[name][0] > appid:
+                exact[name] = (appid, key)
+            if key and normalized.get(key, appid) >= appid:
+                normalized[key] = appid
+
+        collisions = {sys.intern(name): appid for name, (appid, key) in exact.items() if normalized.get(key) != appid}
+        entries = sorted((hash(key), appid) for key, appid in normalized.items())
+        return cls(
+            len(exact),
+            array('q', [key_hash for key_hash, _ in entries]),
+            array('I', [appid for _, appid in entries]),
+            collisions,
+        )
+
+    def _lookup(self, name: str):
+        appid = self._exact.get(name)
+        if appid is not None:
+            return appid
+        key = normalize_game_name(name)
+        if not key:
+            return None
+        key_hash = hash(key)
+        pos = bisect_left(self._hashes, key_hash)
+        if pos < len(self._hashes) and self._hashes[pos] == key_hash:
+            return self._appids[pos]
+        return None
+
+
+class SteamArtworkCache:
+    """TTL/LRU cache of the Steam CDN artwork that exists for an appid.
+
+    Lookups for the same appid share one in-flight probe round.
+    """
+
+    def __init__(self, session: aiohttp.ClientSession, max_size: int = ARTWORK_CACHE_SIZE,
+                 ttl: float = ARTWORK_CACHE_TTL):
+        self._session = session
+        self._max_size = max_size
+        self._ttl = ttl
+        self._entries: OrderedDict[int, tuple[float, dict]] = OrderedDict()
+        self._pending: dict[int, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.probes = 0
+
+    async def async_get(self, appid: int) -> dict:
+        """Return {attribute: url} for the artwork of appid that exists on the CDN.
+
+        The returned dict is shared between callers and must not be modified.
+        """
+        entry = self._entries.get(appid)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self._entries.move_to_end(appid)
+                self.hits += 1
+                return entry[1]
+            del self._entries[appid]
+
+        self.misses += 1
+        pending = self._pending.get(appid)
+        if pending is None:
+            pending = asyncio.ensure_future(self._async_probe(appid))
+            self._pending[appid] = pending
+            pending.add_done_callback(lambda _: self._pending.pop(appid, None))
+        # A cancelled caller must not cancel the probe other callers are waiting for
+        return await asyncio.shield(pending)
+
+    async def _async_probe(self, appid: int) -> dict:
+        image_urls = {attr: STEAM_CDN_URL.format(appid, file) for attr, file in STEAM_IMAGES.items()}
+        game_image_logo_png = STEAM_CDN_URL.format(appid, STEAM_LOGO_PNG)
+
+        results = await asyncio.gather(
+            *[self._async_resource_exists(url) for url in image_urls.values()],
+            self._async_resource_exists(game_image_logo_png)
+        )
+
+        images = {attr: url for (attr, url), exists in zip(image_urls.items(), results) if exists}
+        # logo.png overrides logo.jpg if it exists
+        if results[-1]:
+            images["game_image_logo"] = game_image_logo_png
+
+        # Don't cache partial results, the next lookup will probe again
+        if None not in results:
+            self._entries[appid] = (time.monotonic() + self._ttl, images)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+        return images
+
+    async def _async_resource_exists(self, url: str):
+        """Return True/False if the resource exists, None if the CDN could not be reached."""
+        _LOGGER.debug("Checking if web resource [%s] exists", url)
+        self.probes += 1
+        try:
+            async with self._session.head(url, timeout=ARTWORK_PROBE_TIMEOUT) as response:
+                _LOGGER.debug("Resource [%s] response status = %s", url, response.status)
+                return response.status == 200
+        except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+            _LOGGER.debug("Failed to check web resource [%s]: %s", url, err)
+            return None
+
+    def as_dict(self) -> dict:
+        """Return the artwork cache diagnostics."""
+        return {
+            "cached_apps": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "head_probes": self.probes,
+        }